@@ -0,0 +1,77 @@
+"""
+Micro-benchmark of provider output matching, per-line re.search versus the precompiled, prefiltered matcher.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_matchers
+"""
+import re
+import time
+from tunnels.base import literal_hint
+
+# trimmed captures of real provider output
+captured_logs = {
+    "Cloudflare": (r"https://[^\s]+\.trycloudflare.com", "trycloudflare.com", """\
+2025-08-01T10:12:01Z INF Thank you for trying Cloudflare Tunnel. Doing so, without a Cloudflare account, is a quick way to experiment and try it out.
+2025-08-01T10:12:01Z INF Requesting new quick Tunnel on trycloudflare.com...
+2025-08-01T10:12:03Z INF +--------------------------------------------------------------------------------------------+
+2025-08-01T10:12:03Z INF |  Your quick Tunnel has been created! Visit it at (it may take some time to be reachable):  |
+2025-08-01T10:12:03Z INF |  https://rough-lamp-sparrow-demo.trycloudflare.com                                         |
+2025-08-01T10:12:03Z INF +--------------------------------------------------------------------------------------------+
+2025-08-01T10:12:03Z INF Cannot determine default configuration path. No file [config.yml config.yaml] in [~/.cloudflared ~/.cloudflare-warp ~/cloudflare-warp /etc/cloudflared /usr/local/etc/cloudflared]
+2025-08-01T10:12:03Z INF Version 2025.7.0 (Checksum 5a0e8d0d4c1b)
+2025-08-01T10:12:03Z INF GOOS: linux, GOVersion: go1.22.5, GoArch: arm64
+2025-08-01T10:12:03Z INF Settings: map[ha-connections:1 protocol:quic url:127.0.0.1:8080]
+2025-08-01T10:12:03Z INF Generated Connector ID: 3f5c2a71-9a0e-4c55-8d2e-6b1f0a9c7e21
+2025-08-01T10:12:03Z INF Initial protocol quic
+2025-08-01T10:12:03Z INF ICMP proxy will use 10.0.0.12 as source for IPv4
+2025-08-01T10:12:04Z INF Starting metrics server on 127.0.0.1:20241/metrics
+2025-08-01T10:12:04Z INF Registered tunnel connection connIndex=0 connection=0c1e location=sea01 protocol=quic
+2025-08-01T10:12:40Z ERR  error="stream 29 canceled by remote with error code 0" connIndex=0 event=1 ingressRule=0 originService=http://127.0.0.1:8080
+2025-08-01T10:12:40Z ERR Request failed error="stream 29 canceled by remote with error code 0" connIndex=0 dest=https://rough-lamp-sparrow-demo.trycloudflare.com/vless
+"""),
+    "Zrok": (r"https://[^\s]+\.zrok.io", "zrok.io", """\
+[   0.412]    INFO sdk-golang/ziti.(*ContextImpl).Authenticate: attempting to authenticate
+[   0.873]    INFO sdk-golang/ziti.(*listenerManager).createSessionWithBackoff: {session token=[8e5b1d]} new service session
+[   1.204]    INFO zrok/endpoints/proxy.(*BackendHandler).Run: started
+http://127.0.0.1:8080 -> https://9x2k4lq0abcd.share.zrok.io
+[  33.018]    INFO zrok/endpoints/proxy.newBackendHandler.func1: access from 203.0.113.7:51234
+[  33.019]    WARN zrok/endpoints/proxy.(*BackendHandler).ServeHTTP: websocket upgrade for /vless
+"""),
+}
+
+def old_matcher(regex: str, lines: list[str]) -> int:
+    found = 0
+    for line in lines:
+        if re.search(regex, line):
+            found += 1
+    return found
+
+def new_matcher(pattern: re.Pattern, hint: str, lines: list[str]) -> int:
+    found = None
+    for line in lines:
+        if found or hint not in line:
+            continue
+        match = pattern.search(line)
+        if match:
+            found = match.group(0)
+    return 1 if found else 0
+
+def bench(func, *args, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+if __name__ == "__main__":
+    for provider, (regex, hint, log) in captured_logs.items():
+        # a long running tunnel: the startup output followed by weeks of request logs
+        startup = log.splitlines()
+        lines = startup + startup[-2:] * 50_000
+        old = bench(old_matcher, regex, lines)
+        new = bench(new_matcher, re.compile(regex), hint, lines)
+        derived = literal_hint(regex)
+        print(f"{provider:<11} {len(lines):>7} lines  re.search {old * 1000:8.1f} ms  "
+              f"prefiltered {new * 1000:8.1f} ms  ({old / new:5.1f}x)  derived hint {derived!r}")
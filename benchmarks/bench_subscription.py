@@ -0,0 +1,67 @@
+"""
+Requests per second of the subscription endpoint: the old handler that rendered the template on every
+request, a snapshot rebuilt for every request (worst case, the subscription changes before each one),
+and the snapshot as served normally, with and without a 304.
+
+Run from the repository root:
+
+    MODE=dev python -m benchmarks.bench_subscription
+"""
+import time
+import main
+from helper import subscription
+from v2ray.v2ray import VLESS
+
+class _Record:
+    # just enough of a Tunnel for add_subscription, with a parsed URL as the Clash and sing-box formats need
+    def __init__(self, provider: str, url: str):
+        self.provider_name = provider
+        self.set_url(url)
+
+    def set_url(self, url: str):
+        self.v = VLESS(url)
+        self.v.parse(url)
+        self.url = url
+        self.public_url = url
+
+def vless(user: str, host: str, name: str) -> str:
+    return f"vless://{user}@{host}:443?encryption=none&security=tls&type=ws&path=%2Fvless&sni={host}&host={host}#{name}"
+
+def fill(users: int, providers: int):
+    for u in range(users):
+        for p in range(providers):
+            host = f"tunnel-{u}-{p}.trycloudflare.com"
+            subscription.add_subscription(_Record(f"Provider{p}", vless(f"uuid-{u}", host, f"Provider{p}-user{u}")))
+
+def old_subscription():
+    # the handler before snapshots, kept here as the baseline
+    subscription_list = [url for p in subscription.subscriptions.values() for url in p.values()]
+    return main.flask.render_template("subscription.txt", content="\n".join(subscription_list))
+
+def rps(client, path: str, requests: int, headers: dict = None, before=None) -> float:
+    start = time.perf_counter()
+    for _ in range(requests):
+        if before:
+            before()
+        client.get(path, headers=headers or {})
+    return requests / (time.perf_counter() - start)
+
+if __name__ == "__main__":
+    fill(users=20, providers=10)
+    main.app.add_url_rule("/bench-old-subscription", view_func=old_subscription)
+    client = main.app.test_client()
+    path = f"/{main.subscription_password}/subscription"
+    churn = _Record("Churn", vless("uuid-churn", "churn.trycloudflare.com", "Churn"))
+
+    def invalidate():
+        churn.set_url(vless("uuid-churn", f"churn-{time.perf_counter_ns()}.trycloudflare.com", "Churn"))
+        subscription.add_subscription(churn)
+
+    n = 2000
+    print(f"{len(subscription.subscription_urls())} URLs, {n} requests each")
+    print(f"before: render per request  {rps(client, '/bench-old-subscription', n):8.0f} req/s")
+    print(f"snapshot rebuilt each time  {rps(client, path, n, before=invalidate):8.0f} req/s")
+    print(f"snapshot, identity          {rps(client, path, n):8.0f} req/s")
+    print(f"snapshot, gzip              {rps(client, path, n, {'Accept-Encoding': 'gzip'}):8.0f} req/s")
+    etag = client.get(path).headers["ETag"]
+    print(f"snapshot, 304 Not Modified  {rps(client, path, n, {'If-None-Match': etag}):8.0f} req/s")
@@ -0,0 +1,219 @@
+"""
+Several gunicorn workers sharing one set of tunnels.
+
+The worker holding an exclusive flock on LEADER_LOCK is the leader. It owns the tunnel processes and the scheduler and
+writes the tunnel list and the subscription to the shared store, a table in the STATE_DB SQLite file, after every change.
+The other workers are followers. They serve the subscription, the tunnel list and the dashboard from the store, and queue
+every other API request as a command which the leader runs and answers. When the leader exits its lock is released and
+the first follower to take it becomes the leader, adopting the running tunnels through the state journal.
+"""
+import fcntl
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+from configuration import state_db, leader_lock, command_timeout
+
+logger = logging.getLogger(__name__)
+
+schema = """
+CREATE TABLE IF NOT EXISTS shared (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    generation INTEGER NOT NULL     -- increasing over all keys, followers read what is newer than they have
+);
+CREATE TABLE IF NOT EXISTS commands (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    method TEXT NOT NULL,
+    path TEXT NOT NULL,             -- with the query string
+    headers TEXT,                   -- JSON [[name, value]], Host, cookies and the rest as the client sent them
+    base_url TEXT,                  -- scheme, host and script root the client used
+    body BLOB,
+    state TEXT NOT NULL DEFAULT 'queued', -- queued, running, done
+    response_status INTEGER,
+    response_headers TEXT,          -- JSON [[name, value]]
+    response_body BLOB,
+    created REAL NOT NULL
+);
+"""
+
+command_workers = 8 # commands the leader runs at the same time
+poll_interval = 0.05 # seconds between checks for new commands (leader) or their answer (follower)
+publish_interval = 0.1 # seconds between checks of the leader's state version
+takeover_interval = 1 # seconds between a follower's attempts to become leader
+json_headers = json.dumps([["Content-Type", "application/json"]]) # for the errors the cluster answers itself
+
+class Cluster:
+    def __init__(self, db_path: str, lock_path: str):
+        self.db_path = db_path
+        self.lock_path = lock_path
+        self.is_leader = True # a single process until start() finds out otherwise
+        self.values = {} # key -> latest published value, on followers
+        self.on_update = {} # key -> callable(value), run on followers when a new value arrives
+        self._generation = 0
+        self._db = None
+        self._lock_file = None
+        self._lock = threading.Lock()
+        self._started = False
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.db_path and self.lock_path)
+
+    def start(self, lead: Callable[[], None], publish: Callable[[], dict], version: Callable[[], object], execute: Callable):
+        """
+        Elect a leader among the processes sharing the store. Without STATE_DB this process simply leads.
+        lead() sets this process up to own the tunnels, publish() returns the {key: str} state followers serve,
+        version() is a cheap value that changes whenever publish() would return something new
+        and execute(method, path, headers, body, base_url) -> (status, headers, body) answers a forwarded request,
+        headers being [(name, value)] pairs.
+        """
+        if self._started:
+            return
+        self._started = True
+        self._lead, self._publish, self._version, self._execute = lead, publish, version, execute
+        if not self.enabled:
+            lead()
+            return
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(schema)
+        columns = [column[1] for column in self._db.execute("PRAGMA table_info(commands)")]
+        for column in ("headers", "base_url", "response_headers"): # stores created before requests kept their headers
+            if column not in columns:
+                self._db.execute(f"ALTER TABLE commands ADD COLUMN {column} TEXT")
+        self._lock_file = open(self.lock_path, "a+")
+        if self._try_lock():
+            self._become_leader()
+        else:
+            self.is_leader = False
+            logger.info(f"Worker {os.getpid()} is a follower, the leader owns the tunnels")
+            self.refresh()
+            threading.Thread(target=self._wait_for_leadership, daemon=True, name="cluster-takeover").start()
+
+    def _try_lock(self) -> bool:
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    def _wait_for_leadership(self):
+        while not self._try_lock():
+            time.sleep(takeover_interval)
+        logger.warning(f"Worker {os.getpid()} takes over as leader")
+        self._become_leader()
+
+    def _become_leader(self):
+        self.is_leader = True
+        logger.info(f"Worker {os.getpid()} is the leader")
+        with self._lock:
+            # commands the previous leader never answered, their followers stop waiting after command_timeout
+            self._db.execute(
+                "UPDATE commands SET state = 'done', response_status = 503, response_headers = ?, "
+                "response_body = ? WHERE state = 'running'",
+                (json_headers, b'{"msg": "The leader exited while running this request", "code": "error"}')
+            )
+            self._generation = self._db.execute("SELECT COALESCE(MAX(generation), 0) FROM shared").fetchone()[0]
+        self._lead()
+        threading.Thread(target=self._publish_loop, daemon=True, name="cluster-publish").start()
+        threading.Thread(target=self._command_loop, daemon=True, name="cluster-commands").start()
+
+    # leader
+
+    def _write(self, state: dict):
+        changed = {key: value for key, value in state.items() if self.values.get(key) != value}
+        if not changed:
+            return
+        with self._lock:
+            self._db.execute("BEGIN")
+            for key, value in changed.items():
+                self._generation += 1
+                self._db.execute("INSERT OR REPLACE INTO shared VALUES (?, ?, ?)", (key, value, self._generation))
+            self._db.execute("COMMIT")
+        self.values.update(changed)
+
+    def _publish_loop(self):
+        # the state is only serialized again when its version moved, an idle leader does next to nothing
+        published = None
+        while True:
+            version = self._version() # before publish(), a change made meanwhile shows up next time
+            if version != published:
+                try:
+                    self._write(self._publish())
+                    published = version
+                except Exception as e:
+                    logger.error(f"Publishing state to followers failed: {e}")
+            time.sleep(publish_interval)
+
+    def _command_loop(self):
+        pool = ThreadPoolExecutor(max_workers=command_workers, thread_name_prefix="cluster-command")
+        while True:
+            with self._lock:
+                self._db.execute("DELETE FROM commands WHERE created < ?", (time.time() - 2 * command_timeout,))
+                rows = self._db.execute(
+                    "SELECT id, method, path, headers, body, base_url FROM commands WHERE state = 'queued' ORDER BY id"
+                ).fetchall()
+                for row in rows:
+                    self._db.execute("UPDATE commands SET state = 'running' WHERE id = ?", (row[0],))
+            for row in rows:
+                pool.submit(self._run_command, *row)
+            time.sleep(poll_interval)
+
+    def _run_command(self, command_id: int, method: str, path: str, headers: str, body: bytes, base_url: str):
+        try:
+            status, response_headers, response_body = self._execute(method, path, json.loads(headers or "[]"), body, base_url)
+            response_headers = json.dumps(list(response_headers))
+        except Exception as e:
+            logger.error(f"Forwarded {method} {path} failed: {e}")
+            status, response_headers, response_body = 500, json_headers, b'{"msg": "Check program logs.", "code": "error"}'
+        with self._lock:
+            self._db.execute(
+                "UPDATE commands SET state = 'done', response_status = ?, response_headers = ?, response_body = ? WHERE id = ?",
+                (status, response_headers, response_body, command_id)
+            )
+
+    # follower
+
+    def refresh(self):
+        """Pick up what the leader published since the last call, cheap when nothing changed."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT key, value, generation FROM shared WHERE generation > ? ORDER BY generation", (self._generation,)
+            ).fetchall()
+        for key, value, generation in rows:
+            self._generation = max(self._generation, generation)
+            self.values[key] = value
+            handler = self.on_update.get(key)
+            if handler:
+                handler(value)
+
+    def forward(self, method: str, path: str, headers: list, body: bytes, base_url: str) -> tuple[int, list, bytes]:
+        """
+        Queue a request for the leader and wait for its answer, (status, [(name, value)] headers, body).
+        The leader sees the request's headers and base URL, so it answers as if the client had reached it directly.
+        """
+        with self._lock:
+            command_id = self._db.execute(
+                "INSERT INTO commands (method, path, headers, body, base_url, created) VALUES (?, ?, ?, ?, ?, ?)",
+                (method, path, json.dumps(list(headers)), body, base_url, time.time())
+            ).lastrowid
+        deadline = time.monotonic() + command_timeout
+        while time.monotonic() < deadline:
+            time.sleep(poll_interval)
+            with self._lock:
+                row = self._db.execute(
+                    "SELECT response_status, response_headers, response_body FROM commands WHERE id = ? AND state = 'done'",
+                    (command_id,)
+                ).fetchone()
+                if row:
+                    self._db.execute("DELETE FROM commands WHERE id = ?", (command_id,))
+                    status, response_headers, response_body = row
+                    return status, json.loads(response_headers or json_headers), response_body
+        return 504, json.loads(json_headers), b'{"msg": "The leader did not answer in time, the request may still run.", "code": "error"}'
+
+cluster = Cluster(state_db, leader_lock)
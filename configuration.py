@@ -12,6 +12,8 @@ mode = "dev" if os.getenv("MODE", "development").lower() in ("dev", "development
 bin_path = os.getenv("BIN_PATH", "./bin")
 if not os.path.exists(bin_path):
     os.mkdir(bin_path)
+# results of provider prerequisite checks, reused across boots and workers
+check_cache_path = os.getenv("CHECK_CACHE", os.path.join(bin_path, ".check_cache.json"))
 
 # Frontend
 api_password = os.getenv("API_PASSWORD", "api")
@@ -20,7 +22,16 @@ if len(subscription_password) < 16:
     print("Insecure subscription password, must be at least 16 characters long, contain uppercase letters and digits.")
     subscription_password = hashlib.sha256(subscription_password.encode()).hexdigest()
     print("Using hashed subscription password:", subscription_password)
+# key for the per user subscription tokens, changing it revokes every per user link
+subscription_secret = os.getenv("SUBSCRIPTION_SECRET", subscription_password)
 custom_frontend = os.getenv("CUSTOM_FRONTEND", "false").lower() in ("true", "1", "yes")
+# seconds a dashboard event stream stays open before the browser reconnects, each one holds a server thread
+event_stream_timeout = int(os.getenv("EVENT_STREAM_TIMEOUT", 300))
+# how many subscription changes are kept for the delta endpoint, older versions get a full list
+subscription_history = int(os.getenv("SUBSCRIPTION_HISTORY", 1000))
+
+# Providers to use, comma separated class names (e.g. Cloudflare,Zrok), all providers when empty
+enabled_providers = [p.strip() for p in os.getenv("PROVIDERS", "").split(",") if p.strip()]
 
 # Tunnel URLs
 tunnel_urls_env = os.getenv("TUNNEL_URLS", "")
@@ -51,7 +62,44 @@ default_keepalived = int(os.getenv('DEFAULT_KEEPALIVED', 0))
 default_expiry = int(os.getenv('DEFAULT_EXPIRY', 28800))
 default_timer = {'keepalive': default_keepalived, 'expire': default_expiry}
 
+# Number of output lines kept in memory for each tunnel
+tunnel_log_lines = int(os.getenv("TUNNEL_LOG_LINES", 500))
+
+# Keepalive rotation, "overlap" brings up the replacement before stopping the old process, "restart" stops first
+rotation_mode = os.getenv("ROTATION_MODE", "overlap").lower()
+
+# Standby pool, pre-started spare tunnels per backend and provider (<PROVIDER>_STANDBY overrides per provider)
+standby_pool_size = int(os.getenv("STANDBY_POOL", 0))
+
+# Supervisor, restart dead tunnels with exponential backoff (seconds)
+auto_restart = os.getenv("AUTO_RESTART", "true").lower() in ("true", "1", "yes")
+restart_backoff = float(os.getenv("RESTART_BACKOFF", 2))
+restart_backoff_max = float(os.getenv("RESTART_BACKOFF_MAX", 300))
+restart_stable_after = float(os.getenv("RESTART_STABLE_AFTER", 60)) # uptime after which the backoff starts over
+
+# Tunnel engine, how many tunnels of one provider may be starting at the same time
+start_concurrency = int(os.getenv("START_CONCURRENCY", 8))
+# Bulk operations, how many tunnels are stopped/started at the same time (mostly waiting on processes),
+# and seconds a stop waits after SIGTERM to the process group before SIGKILL
+bulk_workers = int(os.getenv("BULK_WORKERS", 64))
+stop_timeout = float(os.getenv("STOP_TIMEOUT", 10))
+# seconds the tunnels get to exit when the app shuts down, all of them at once, before they are killed
+shutdown_timeout = float(os.getenv("SHUTDOWN_TIMEOUT", 0.5))
+# SQLite journal of running tunnels, their processes outlive the app and are adopted on the next start.
+# Empty to stop every tunnel on shutdown instead
+state_db = os.getenv("STATE_DB", "state.db")
+# provider processes write their output to a file of their own in this directory, which the app follows, so a process
+# that outlives the app keeps a place to write to. Files are cut back to empty past TUNNEL_OUTPUT_MAX bytes
+tunnel_output_dir = os.getenv("TUNNEL_OUTPUT_DIR", "tunnel_output")
+tunnel_output_max = int(os.getenv("TUNNEL_OUTPUT_MAX", 1024 * 1024))
+# gunicorn workers elect one leader through this lock file, the others serve reads from STATE_DB (see cluster.py)
+leader_lock = os.getenv("LEADER_LOCK", f"{state_db}.lock" if state_db else "")
+# seconds a follower worker waits for the leader to answer a request it forwarded
+command_timeout = float(os.getenv("COMMAND_TIMEOUT", 120))
+
 # Logging configuration
+log_file = os.getenv("LOG_FILE", "app.log")
+
 class CustomFormatter(logging.Formatter):
     grey = "\x1b[38;20m"
     yellow = "\x1b[33;20m"
@@ -77,7 +125,7 @@ def setup_logging():
     streamHandler = logging.StreamHandler()
     streamHandler.setFormatter(CustomFormatter())
     fileHandler = RotatingFileHandler(
-        filename='app.log',
+        filename=log_file,
         mode="a",
         maxBytes=256*1024, # 256 KB
         backupCount=1
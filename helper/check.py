@@ -1,13 +1,69 @@
 import os
 import subprocess
 import re
+import json
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from configuration import check_cache_path
+
+_cache_lock = threading.Lock()
+_cache = None
+check_timings = {} # module name -> {"<position>:<check name>": seconds}, for the startup report
+
+def _load_cache() -> dict:
+    global _cache
+    if _cache is None:
+        try:
+            with open(check_cache_path) as f:
+                _cache = json.load(f)
+        except (OSError, ValueError):
+            _cache = {}
+    return _cache
+
+def _save_cache():
+    tmp_path = f"{check_cache_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump(_cache, f)
+        os.replace(tmp_path, check_cache_path) # atomic, other workers may be reading it
+    except OSError:
+        pass
+
+def run_check_command(cli_command: list[str], timeout: int = 10, cached: bool = True) -> tuple[int, str]:
+    """
+    Run a check command without a shell, e.g. ["node", "--version"], and return (returncode, stdout).
+    Results are cached on disk keyed by the executable's path, its mtime and PATH, so the next boot
+    (and every other gunicorn worker) skips the subprocess. Returns (127, "") when the executable is missing.
+    """
+    executable = shutil.which(cli_command[0])
+    if not executable:
+        return 127, ""
+    executable = os.path.realpath(executable)
+    key = json.dumps([cli_command, executable, os.stat(executable).st_mtime, os.environ.get("PATH", "")])
+    if cached:
+        with _cache_lock:
+            if key in _load_cache():
+                return tuple(_cache[key])
+    try:
+        result = subprocess.run(cli_command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return 124, "" # not cached, may work next time
+    except OSError:
+        return 126, ""
+    if cached:
+        with _cache_lock:
+            _load_cache()[key] = [result.returncode, result.stdout]
+            _save_cache()
+    return result.returncode, result.stdout
 
 def check_binary(path: str) -> bool:
     """
     Check if a binary exists at the specified path.
     """
-    fullpath = subprocess.run(f"which {path}", shell=True, stdout=subprocess.PIPE, text=True).stdout.strip()
-    return os.path.isfile(fullpath) and os.access(fullpath, os.X_OK)
+    fullpath = shutil.which(path)
+    return fullpath is not None and os.path.isfile(fullpath) and os.access(fullpath, os.X_OK)
 
 def check_all_binaries(bin_path: str, binary_name: str) -> str:
     """
@@ -33,23 +89,20 @@ def check_node_runtime() -> bool:
     """
     Check if Node.js is installed and accessible.
     """
-    try:
-        result = subprocess.run(['node', '--version'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        return result.returncode == 0
-    except FileNotFoundError:
-        return False
+    returncode, _ = run_check_command(['node', '--version'])
+    return returncode == 0
 
 def check_binary_status(cli_command: str, expected_output=None, unexpected_output=None) -> bool:
     """
     Check if a binary command succeeds and optionally match output using regex.
     """
     try:
-        result = subprocess.run(cli_command.split(), stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        if result.returncode != 0:
+        returncode, stdout = run_check_command(cli_command.split())
+        if returncode != 0:
             return False
-        if expected_output and not re.search(expected_output, result.stdout):
+        if expected_output and not re.search(expected_output, stdout):
             return False
-        if unexpected_output and re.search(unexpected_output, result.stdout):
+        if unexpected_output and re.search(unexpected_output, stdout):
             return False
         return True
     except Exception:
@@ -60,6 +113,13 @@ from typing import Tuple, Optional, List
 import logging
 
 class Validator(ABC):
+    @property
+    def name(self) -> str:
+        """
+        What the check looks at, for the startup report
+        """
+        return self.__class__.__name__
+
     @abstractmethod
     def validate(self) -> Tuple[bool, str]:
         """
@@ -78,6 +138,10 @@ class BinaryCheck(Validator):
         self.binary_path = binary_path
         self.binary_name = binary_name
         self.checked_binary = None
+
+    @property
+    def name(self) -> str:
+        return f"{self.__class__.__name__}({self.binary_name})"
     
     def validate(self) -> Tuple[bool, str]:
         self.checked_binary = check_all_binaries(self.bin_path, self.binary_path)
@@ -87,33 +151,26 @@ class BinaryCheck(Validator):
 
 class NodeRuntimeCheck(Validator):
     def validate(self) -> Tuple[bool, str]:
-        try:
-            result = subprocess.run(["node", "--version"], 
-                                 capture_output=True, text=True, timeout=5)
-            if result.returncode != 0:
-                return False, "Node.js runtime not found or not working"
-            
-            return True, ""
-        except (subprocess.TimeoutExpired, FileNotFoundError):
+        returncode, _ = run_check_command(["node", "--version"], timeout=5)
+        if returncode == 127:
             return False, "Node.js runtime not found"
+        if returncode != 0:
+            return False, "Node.js runtime not found or not working"
+        return True, ""
 
 class DockerCheck(Validator):
     def validate(self) -> Tuple[bool, str]:
-        try:
-            result = subprocess.run(["docker", "--version"], 
-                                 capture_output=True, text=True, timeout=10)
-            if result.returncode != 0:
-                return False, "Docker not found or not working"
-            
-            # Check if Docker daemon is running
-            result = subprocess.run(["docker", "info"], 
-                                 capture_output=True, text=True, timeout=10)
-            if result.returncode != 0:
-                return False, "Docker daemon is not running"
-            
-            return True, ""
-        except (subprocess.TimeoutExpired, FileNotFoundError):
+        returncode, _ = run_check_command(["docker", "--version"])
+        if returncode == 127:
             return False, "Docker not found"
+        if returncode != 0:
+            return False, "Docker not found or not working"
+
+        # Check if Docker daemon is running, this can change between boots so it is never cached
+        returncode, _ = run_check_command(["docker", "info"], cached=False)
+        if returncode != 0:
+            return False, "Docker daemon is not running"
+        return True, ""
 
 class CustomCheck(Validator):
     def __init__(self, function, *args, **kwargs):
@@ -125,6 +182,10 @@ class CustomCheck(Validator):
         self.args = args
         self.kwargs = kwargs
 
+    @property
+    def name(self) -> str:
+        return f"{self.__class__.__name__}({getattr(self.function, '__name__', repr(self.function))})"
+
     def validate(self) -> Tuple[bool, str]:
         try:
             result = self.function(*self.args, **self.kwargs)
@@ -148,10 +209,21 @@ def validate_provider(checks: List[Validator], module_name: str) -> Tuple[bool,
     logger = logging.getLogger(module_name)
     disabled = False
     context = {}
-    
-    for check in checks:
-        is_valid, error_msg = check.validate()
-        
+    timings = check_timings.setdefault(module_name, {})
+
+    def timed_validate(index: int, check: Validator) -> Tuple[bool, str]:
+        started = time.perf_counter()
+        try:
+            return check.validate()
+        finally:
+            # the index keeps two checks of the same kind (e.g. two CustomChecks) apart
+            timings[f"{index}:{check.name}"] = round(time.perf_counter() - started, 4)
+
+    # checks are independent of each other, run them concurrently
+    with ThreadPoolExecutor(max_workers=max(1, len(checks))) as executor:
+        results = list(executor.map(timed_validate, range(len(checks)), checks))
+
+    for check, (is_valid, error_msg) in zip(checks, results):
         if not is_valid:
             logger.warning(f"{module_name}: {error_msg}")
             disabled = True
@@ -0,0 +1,78 @@
+import itertools
+import logging
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+class Subscription:
+    def __init__(self, maxsize: int):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.overflowed = False # fell behind and missed events, needs a fresh snapshot
+
+    def get(self, timeout: float):
+        """Next (id, type, data), or None when nothing happened within timeout."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+class EventBus:
+    """
+    In-process publish/subscribe for state changes, e.g. a tunnel starting or stopping.
+    Publishers call publish(type, obj). The serializer registered for the type turns obj into the event data once,
+    however many subscribers there are, and nothing is serialized while nobody listens.
+    An event whose data is identical to the last one sent for the same object (by its id attribute) is dropped.
+    Each subscriber has a bounded queue, one that falls behind is marked overflowed instead of blocking publishers.
+    """
+    def __init__(self, queue_size: int = 1000):
+        self.queue_size = queue_size
+        self.serializers = {} # event type -> callable(obj) -> data, a str is sent as already encoded JSON
+        self._subscribers = set()
+        self._last = {} # (event type, object id) -> data last sent
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def subscribe(self) -> Subscription:
+        subscription = Subscription(self.queue_size)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, event_type: str, obj):
+        with self._lock:
+            subscribers = list(self._subscribers)
+            if not subscribers:
+                self._last.clear() # whoever connects next starts from a snapshot
+                return
+        serializer = self.serializers.get(event_type)
+        try:
+            data = serializer(obj) if serializer else obj
+        except Exception as e:
+            logger.error(f"Serializing {event_type} event failed: {e}")
+            return
+        key = (event_type, getattr(obj, "id", None))
+        if key[1] is not None:
+            with self._lock:
+                if self._last.get(key) == data:
+                    return
+                self._last[key] = data
+        event = (next(self._ids), event_type, data)
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(event)
+            except queue.Full:
+                subscription.overflowed = True
+
+bus = EventBus()
+
+def publish(event_type: str, obj):
+    bus.publish(event_type, obj)
@@ -0,0 +1,51 @@
+import threading
+
+class LogRing:
+    """
+    Fixed-capacity buffer holding the latest output lines of one tunnel as utf-8 bytes.
+    Every line gets an absolute offset (0, 1, 2, ...) so readers can ask for "everything after offset N"
+    even after older lines have been overwritten.
+    Keeps a queue-like put() so providers can keep calling self.log_queue.put(line).
+    The buffer grows up to capacity as lines arrive, a tunnel that never starts costs almost nothing.
+    """
+    __slots__ = ("capacity", "_lines", "total", "_lock")
+
+    def __init__(self, capacity: int):
+        self.capacity = max(1, capacity)
+        self._lines = []
+        self.total = 0 # number of lines ever written, also the offset of the next line
+        self._lock = threading.Lock()
+
+    def put(self, line):
+        if line is None: # end of output marker from the old queue based readers
+            return
+        encoded = line.encode("utf-8", errors="replace")
+        with self._lock:
+            if len(self._lines) < self.capacity:
+                self._lines.append(encoded)
+            else:
+                self._lines[self.total % self.capacity] = encoded
+            self.total += 1
+
+    @property
+    def first(self) -> int:
+        """Offset of the oldest line still held."""
+        return max(0, self.total - self.capacity)
+
+    def _read(self, start: int, end: int) -> list[str]:
+        return [self._lines[i % self.capacity].decode("utf-8") for i in range(start, end)]
+
+    def tail(self, n: int) -> list[str]:
+        with self._lock:
+            return self._read(max(self.first, self.total - max(0, n)), self.total)
+
+    def since(self, offset: int) -> tuple[list[str], int]:
+        """
+        Returns (lines after offset, offset to pass next time).
+        Lines already overwritten are skipped.
+        """
+        with self._lock:
+            return self._read(min(max(offset, self.first), self.total), self.total), self.total
+
+    def __len__(self):
+        return self.total - self.first
@@ -0,0 +1,268 @@
+"""
+Block index of the log files for server side search.
+
+Each file is cut into blocks of about block_size bytes on record boundaries. A block keeps its byte range, the time
+range of its records and the levels, loggers and providers that appear in it, so a search only reads the blocks that
+can match. Only newly written bytes are indexed on each search. Files are told apart by inode and a crc of their first
+bytes, so the index of app.log is reused once RotatingFileHandler renames it to app.log.1.
+"""
+import os
+import re
+import threading
+import time
+import zlib
+from dataclasses import dataclass, field
+
+block_size = 64 * 1024
+fingerprint_size = 64
+# levels rare enough to keep the position of every record, a search for them reads only those records
+posted_levels = {"WARNING", "ERROR", "CRITICAL"}
+
+# "%(asctime)s - %(name)s - %(levelname)s - %(message)s" as set up in configuration.setup_logging
+record_pattern = re.compile(rb"(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d),\d+ - (\S+) - ([A-Z]+) - ")
+
+@dataclass
+class Block:
+    start: int
+    end: int
+    first_time: str = None
+    last_time: str = None
+    levels: set = field(default_factory=set)
+    loggers: set = field(default_factory=set)
+    providers: set = field(default_factory=set)
+    postings: list = field(default_factory=list) # Posting of every record at a posted level
+
+@dataclass
+class Posting:
+    start: int
+    end: int
+    level: str
+    logger: str
+    providers: set
+
+@dataclass
+class FileIndex:
+    inode: int
+    fingerprint: int = 0
+    indexed: int = 0 # offset up to which whole records are indexed
+    blocks: list = field(default_factory=list)
+
+@dataclass
+class Record:
+    offset: int
+    end: int
+    time: str
+    logger: str
+    level: str
+    providers: set
+    text: str
+
+    def to_dict(self) -> dict:
+        return {"time": self.time, "logger": self.logger, "level": self.level, "text": self.text}
+
+def _parse_records(data: bytes, base: int, providers: list[str]):
+    """
+    Records in data, a record being a header line and the lines after it without one (tracebacks).
+    """
+    lowered = [(p, p.lower().encode()) for p in providers]
+    record = None
+    offset = base
+    for line in data.split(b"\n")[:-1]:
+        match = record_pattern.match(line)
+        if match:
+            if record:
+                yield record
+            time_, logger, level = (g.decode() for g in match.groups())
+            lower = line.lower()
+            record = Record(offset, offset, time_, logger, level, {p for p, name in lowered if name in lower}, line.decode("utf-8", errors="replace"))
+        elif record:
+            record.text += "\n" + line.decode("utf-8", errors="replace")
+        offset += len(line) + 1
+        if record:
+            record.end = offset
+    if record:
+        yield record
+
+def _to_log_time(value) -> str | None:
+    """
+    Unix timestamp or ISO 8601 to the local "YYYY-mm-dd HH:MM:SS" asctime uses, which compares correctly as a string.
+    """
+    if value is None or value == "":
+        return None
+    try:
+        return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(float(value)))
+    except ValueError:
+        return str(value).replace("T", " ")[:19]
+
+class LogIndex:
+    def __init__(self, path: str, providers: list[str] = ()):
+        self.path = path
+        self.providers = list(providers)
+        self.files = {} # (inode, fingerprint) -> FileIndex
+        self._lock = threading.Lock()
+
+    def _paths(self) -> list[str]:
+        # newest first
+        paths = [self.path]
+        i = 1
+        while os.path.exists(f"{self.path}.{i}"):
+            paths.append(f"{self.path}.{i}")
+            i += 1
+        return paths
+
+    def refresh(self) -> list[tuple[str, FileIndex]]:
+        """
+        Index what was written since the last call, returns (path, index) of every log file, newest first.
+        """
+        current = []
+        with self._lock:
+            for path in self._paths():
+                try:
+                    with open(path, "rb") as f:
+                        inode = os.fstat(f.fileno()).st_ino
+                        index = self._find(inode, f)
+                        if index is None:
+                            index = FileIndex(inode)
+                        self._extend(index, f)
+                        index.fingerprint = zlib.crc32(_head(f, index.indexed))
+                except FileNotFoundError:
+                    continue
+                self.files[(inode, index.fingerprint)] = index
+                current.append((path, index))
+            alive = {(index.inode, index.fingerprint) for _, index in current}
+            self.files = {key: index for key, index in self.files.items() if key in alive}
+        return current
+
+    def _find(self, inode: int, f) -> FileIndex | None:
+        # the same file, possibly renamed, as long as it was not truncated or replaced by one reusing the inode
+        size = os.fstat(f.fileno()).st_size
+        for (known_inode, fingerprint), index in self.files.items():
+            if known_inode == inode and size >= index.indexed and zlib.crc32(_head(f, index.indexed)) == fingerprint:
+                return index
+        return None
+
+    def _extend(self, index: FileIndex, f):
+        size = os.fstat(f.fileno()).st_size
+        while index.indexed < size:
+            f.seek(index.indexed)
+            data = f.read(block_size)
+            cut = _record_boundary(data) if len(data) == block_size else data.rfind(b"\n") + 1
+            if cut <= 0:
+                return # a record still being written
+            block = Block(index.indexed, index.indexed + cut)
+            for record in _parse_records(data[:cut], index.indexed, self.providers):
+                block.first_time = block.first_time or record.time
+                block.last_time = record.time
+                block.levels.add(record.level)
+                block.loggers.add(record.logger)
+                block.providers |= record.providers
+                if record.level in posted_levels:
+                    block.postings.append(Posting(record.offset, record.end, record.level, record.logger, record.providers))
+            index.blocks.append(block)
+            index.indexed = block.end
+
+    def search(self, levels=None, loggers=None, providers=None, since=None, until=None, text=None,
+               limit: int = 100, before: str = None) -> dict:
+        """
+        Records matching every given filter, newest first.
+        levels and providers are sets of names, loggers are prefixes (e.g. "tunnels" matches "tunnels.zrok"),
+        since/until a unix timestamp or ISO time, text a case insensitive substring.
+        Pass the returned "next" as before= to get the following page.
+        """
+        levels = {l.upper() for l in levels} if levels else None
+        loggers = tuple(loggers) if loggers else None
+        canonical = {p.lower(): p for p in self.providers}
+        providers = {canonical.get(p.lower(), p) for p in providers} if providers else None
+        since, until = _to_log_time(since), _to_log_time(until)
+        text = text.lower() if text else None
+        before_inode, before_offset = (int(x) for x in before.split(":")) if before else (None, None)
+
+        results, scanned, total, started = [], 0, 0, before is None
+        for path, index in self.refresh():
+            total += index.indexed
+            if not started:
+                if index.inode != before_inode:
+                    continue
+                started = True
+            else:
+                before_offset = None
+            for block in reversed(index.blocks):
+                if before_offset is not None and block.start >= before_offset:
+                    continue
+                if not self._block_matches(block, levels, loggers, providers, since, until):
+                    continue
+                with open(path, "rb") as f:
+                    for start, end in self._regions(block, levels, loggers, providers):
+                        f.seek(start)
+                        data = f.read(end - start)
+                        scanned += len(data)
+                        for record in reversed(list(_parse_records(data, start, self.providers))):
+                            if before_offset is not None and record.offset >= before_offset:
+                                continue
+                            if self._record_matches(record, levels, loggers, providers, since, until, text):
+                                results.append(record.to_dict())
+                                if len(results) == limit:
+                                    return {
+                                        "results": results, "next": f"{index.inode}:{record.offset}",
+                                        "scanned_bytes": scanned, "total_bytes": total,
+                                    }
+        return {"results": results, "next": None, "scanned_bytes": scanned, "total_bytes": total}
+
+    @staticmethod
+    def _regions(block: Block, levels, loggers, providers) -> list[tuple[int, int]]:
+        """
+        Byte ranges of a block to read, newest first. Searches for posted levels only read the posted records.
+        """
+        if not levels or not levels <= posted_levels:
+            return [(block.start, block.end)]
+        return [
+            (p.start, p.end) for p in reversed(block.postings)
+            if p.level in levels
+            and (not loggers or p.logger.startswith(loggers))
+            and (not providers or providers & p.providers)
+        ]
+
+    @staticmethod
+    def _block_matches(block: Block, levels, loggers, providers, since, until) -> bool:
+        if block.first_time is None:
+            return False
+        if since and block.last_time < since:
+            return False
+        if until and block.first_time > until:
+            return False
+        if levels and not levels & block.levels:
+            return False
+        if loggers and not any(l.startswith(loggers) for l in block.loggers):
+            return False
+        if providers and not providers & block.providers:
+            return False
+        return True
+
+    @staticmethod
+    def _record_matches(record: Record, levels, loggers, providers, since, until, text) -> bool:
+        return (
+            (not levels or record.level in levels)
+            and (not loggers or record.logger.startswith(loggers))
+            and (not providers or providers & record.providers)
+            and (not since or record.time >= since)
+            and (not until or record.time <= until)
+            and (not text or text in record.text.lower())
+        )
+
+def _head(f, length: int) -> bytes:
+    f.seek(0)
+    return f.read(min(fingerprint_size, length))
+
+def _record_boundary(data: bytes) -> int:
+    """
+    Offset of the last record header in data, so blocks never split a traceback from its record.
+    Falls back to the last line break when one record fills the whole block.
+    """
+    position = len(data)
+    while True:
+        newline = data.rfind(b"\n", 0, position)
+        if newline == -1:
+            return data.rfind(b"\n") + 1
+        if record_pattern.match(data, newline + 1) and newline + 1 < len(data):
+            return newline + 1
+        position = newline
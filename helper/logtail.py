@@ -0,0 +1,112 @@
+"""
+Reading the end of the log file without reading the whole file.
+
+Positions are handed out as cursors "<inode>:<offset>:<fingerprint>". RotatingFileHandler renames app.log to app.log.1
+on rollover, which keeps the inode, so a cursor can still be followed into the backup and on into the new file.
+The fingerprint is a crc of the first bytes of the file, inode numbers of deleted backups get reused by new files.
+"""
+import os
+import zlib
+
+block_size = 8 * 1024
+max_read = 1024 * 1024 # bytes read by one read_after call at most, the cursor picks up from there next time
+fingerprint_size = 64
+
+def _fingerprint(f, offset: int) -> int:
+    f.seek(0)
+    return zlib.crc32(f.read(min(fingerprint_size, offset)))
+
+def make_cursor(inode: int, offset: int, fingerprint: int = 0) -> str:
+    return f"{inode}:{offset}:{fingerprint}"
+
+def parse_cursor(cursor: str) -> tuple[int, int, int]:
+    inode, offset, fingerprint = cursor.split(":")
+    return int(inode), int(offset), int(fingerprint)
+
+def _decode(parts: list[bytes]) -> list[str]:
+    return [line.decode("utf-8", errors="replace").rstrip("\r") for line in parts]
+
+def tail(path: str, lines: int = 100) -> tuple[list[str], str]:
+    """
+    Last lines of the file, read backwards from EOF a block at a time, and the cursor just past them.
+    Only whole lines are returned, a line still being written is left for the next read_after.
+    """
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return [], make_cursor(0, 0)
+    with f:
+        st = os.fstat(f.fileno())
+        data = b""
+        position = st.st_size
+        while position > 0 and data.count(b"\n") <= lines:
+            step = min(block_size, position)
+            position -= step
+            f.seek(position)
+            data = f.read(step) + data
+        cut = data.rfind(b"\n")
+        end = position + cut + 1
+        cursor = make_cursor(st.st_ino, end, _fingerprint(f, end))
+    if cut == -1:
+        return [], cursor
+    parts = data[:cut].split(b"\n")
+    if position > 0:
+        parts = parts[1:] # started in the middle of a line
+    return _decode(parts[-lines:]) if lines > 0 else [], cursor
+
+def _backups(path: str):
+    # app.log.1, app.log.2 ... as RotatingFileHandler names them
+    i = 1
+    while os.path.exists(f"{path}.{i}"):
+        yield f"{path}.{i}"
+        i += 1
+
+def _read_from(path: str, offset: int, fingerprint: int, limit_lines: int) -> tuple[list[str], int, int, bool] | None:
+    """
+    Up to limit_lines whole lines from offset, reading at most max_read bytes.
+    Returns the lines, the cursor offset and fingerprint just past them and whether that is the end of the file,
+    or None when the file is not the one the cursor was taken from.
+    """
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if offset > size or _fingerprint(f, offset) != fingerprint:
+            return None
+        f.seek(offset)
+        data = f.read(max(0, min(max_read, size - offset)))
+        parts = data.split(b"\n")[:-1][:limit_lines] # the last part is an unfinished line or empty
+        offset += sum(len(part) + 1 for part in parts)
+        return _decode(parts), offset, _fingerprint(f, offset), offset >= size
+
+def read_after(path: str, cursor: str, limit_lines: int = 1000) -> tuple[list[str], str, bool]:
+    """
+    Lines written after the cursor, following a rollover from the backup into the new file.
+    Returns (lines, next cursor, reset), reset is True when the cursor could not be followed (the backup it
+    pointed into is gone, or the file was truncated), the lines are then the tail of the current file.
+    """
+    try:
+        inode, offset, fingerprint = parse_cursor(cursor)
+        current = os.stat(path).st_ino
+    except ValueError:
+        return (*tail(path, limit_lines), True)
+    except FileNotFoundError:
+        return [], make_cursor(0, 0), False
+
+    lines = []
+    if inode != current:
+        read = None
+        for backup in _backups(path):
+            if os.stat(backup).st_ino == inode:
+                read = _read_from(backup, offset, fingerprint, limit_lines)
+                break
+        if read is None:
+            return (*tail(path, limit_lines), True)
+        lines, offset, fingerprint, at_end = read
+        if not at_end or len(lines) == limit_lines:
+            return lines, make_cursor(inode, offset, fingerprint), False
+        inode, offset, fingerprint = current, 0, 0 # finished the backup, carry on in the new file (crc32 of nothing is 0)
+
+    read = _read_from(path, offset, fingerprint, limit_lines - len(lines))
+    if read is None:
+        return (*tail(path, limit_lines), True)
+    found, offset, fingerprint, _ = read
+    return lines + found, make_cursor(inode, offset, fingerprint), False
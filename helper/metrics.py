@@ -0,0 +1,64 @@
+import threading
+from bisect import bisect_left
+
+# upper bounds in seconds, the last bucket catches everything above
+default_buckets = (0.25, 0.5, 1, 2, 3, 5, 8, 10, 15, 20, 30)
+
+class Histogram:
+    def __init__(self, buckets=default_buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def to_dict(self) -> dict:
+        labels = [f"le_{b}" for b in self.buckets] + ["inf"]
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 4),
+            "avg": round(self.sum / self.count, 4) if self.count else None,
+            "min": self.min,
+            "max": self.max,
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+_lock = threading.Lock()
+histograms = {} # metric name -> provider name -> Histogram
+counters = {} # metric name -> provider name -> int
+
+def observe(metric: str, provider: str, value: float):
+    """
+    Record a value for a provider, e.g. observe("time_to_url", "Zrok", 3.2)
+    """
+    with _lock:
+        per_provider = histograms.setdefault(metric, {})
+        if provider not in per_provider:
+            per_provider[provider] = Histogram()
+        per_provider[provider].observe(value)
+
+def increment(metric: str, provider: str, amount: int = 1):
+    """
+    Count an event for a provider, e.g. increment("restarts", "Zrok")
+    """
+    with _lock:
+        per_provider = counters.setdefault(metric, {})
+        per_provider[provider] = per_provider.get(provider, 0) + amount
+
+def snapshot() -> dict:
+    with _lock:
+        return {
+            "histograms": {
+                metric: {p: h.to_dict() for p, h in per_provider.items()}
+                for metric, per_provider in histograms.items()
+            },
+            "counters": {metric: dict(per_provider) for metric, per_provider in counters.items()},
+        }
@@ -0,0 +1,239 @@
+import atexit
+import logging
+import os
+import queue
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from configuration import stop_timeout, shutdown_timeout, tunnel_output_dir
+from helper.reactor import reactor
+
+logger = logging.getLogger(__name__)
+
+# every provider process group that may still be running, by leader
+_groups = set()
+keep = set() # pids of the leaders left running at exit, recorded in the state journal for the next start to adopt
+_lock = threading.Lock()
+
+def spawn(args, **kwargs) -> subprocess.Popen:
+    """
+    subprocess.Popen in a new session, so the child leads its own process group and whatever it starts in turn
+    (wrapper scripts, node under lt) can be signalled with it. The group is torn down when the app exits.
+    """
+    process = subprocess.Popen(args, start_new_session=True, **kwargs)
+    with _lock:
+        _groups.difference_update([p for p in _groups if p.returncode is not None]) # reaped, and so is their group
+        _groups.add(process)
+    return process
+
+def spawn_logged(args, name: str, text: bool = False, **kwargs) -> subprocess.Popen:
+    """
+    spawn() with stdout and stderr appended to a new file in TUNNEL_OUTPUT_DIR, process.output_path, which the app
+    follows (reactor.follow, woken by inotify) instead of reading a pipe. The file outlives the app, so a process left
+    running for the next start keeps writing without SIGPIPE and the next start follows it from where it is.
+    With text, process.stdout follows the file as text lines, for providers reading their output themselves.
+    """
+    os.makedirs(tunnel_output_dir, exist_ok=True)
+    fd, path = tempfile.mkstemp(prefix=f"{name}-", suffix=".log", dir=tunnel_output_dir)
+    os.close(fd)
+    try:
+        with open(path, "ab") as output: # O_APPEND, the child keeps writing at the end when the file is cut back
+            process = spawn(args, stdout=output, stderr=subprocess.STDOUT, **kwargs)
+    except BaseException:
+        os.unlink(path)
+        raise
+    process.output_path = path
+    if text:
+        process.stdout = OutputFollower(process)
+    return process
+
+def remove_output(path: str | None):
+    """Delete the output file of a process that is gone for good, the app has read it by then."""
+    if path:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+class OutputFollower:
+    """
+    The text lines a process writes to its output file, as a blocking iterator like Popen.stdout with text=True,
+    for providers reading their output themselves. The reactor reads the file and queues the lines.
+    Iteration ends once the process has exited and all it wrote is read.
+    """
+    def __init__(self, process, offset: int = 0):
+        self.path = process.output_path
+        self.closed = False
+        self._lines = queue.SimpleQueue()
+        reactor.follow(process, self._put, lambda: self._lines.put(None), offset)
+
+    def _put(self, line: str):
+        if not self.closed:
+            self._lines.put(line + "\n")
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        line = None if self.closed else self._lines.get()
+        if line is None:
+            if not self.closed:
+                self.closed = True
+                remove_output(self.path) # gone, and everything it wrote has been read
+            raise StopIteration
+        return line
+
+    def readline(self) -> str:
+        return next(self, "")
+
+    def close(self):
+        self.closed = True # the reactor keeps reading until the process exits, lines are dropped
+
+def start_time(pid: int) -> int | None:
+    """
+    When the process started, in clock ticks since boot (/proc/<pid>/stat), None when it is gone or a zombie.
+    Together with the pid it identifies a process, pids get reused.
+    """
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    fields = stat[stat.rindex(b")") + 2:].split() # the command name in parentheses may contain spaces
+    return None if fields[0] == b"Z" else int(fields[19])
+
+class AdoptedProcess:
+    """
+    Stand-in for the Popen of a provider process a previous run of the app started and left running.
+    It is not our child, so it can't be waited on: exit is noticed by polling /proc (or by the reactor through a pidfd),
+    and the exit code is unknown, -1 once it is gone. It still writes to output_path, the file spawn_logged gave it.
+    """
+    def __init__(self, pid: int, started: int, args: list[str], output_path: str | None):
+        self.pid = pid
+        self.started = started
+        self.args = args
+        self.output_path = output_path
+        self.stdout = None
+        self.returncode = None
+
+    def poll(self) -> int | None:
+        if self.returncode is None and start_time(self.pid) != self.started:
+            self.returncode = -1
+        return self.returncode
+
+    def wait(self, timeout: float = None) -> int:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.poll() is None:
+            if deadline is not None and time.monotonic() >= deadline:
+                raise subprocess.TimeoutExpired(self.args, timeout)
+            time.sleep(0.02)
+        return self.returncode
+
+    def send_signal(self, sig: int):
+        if self.poll() is None:
+            os.kill(self.pid, sig)
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+def adopt(pid: int, started: int, args: list[str], output_path: str | None) -> AdoptedProcess | None:
+    """
+    The process a journal recorded, if it is still the same process and still leads its own process group.
+    """
+    if not pid or start_time(pid) != started:
+        return None
+    try:
+        if os.getpgid(pid) != pid:
+            return None
+    except ProcessLookupError:
+        return None
+    process = AdoptedProcess(pid, started, args, output_path)
+    with _lock:
+        _groups.add(process)
+    return process
+
+def _signal_group(process: subprocess.Popen, sig: int):
+    try:
+        os.killpg(process.pid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass # the whole group is gone already
+
+def _group_alive(process: subprocess.Popen) -> bool:
+    try:
+        os.killpg(process.pid, 0)
+        return True
+    except (ProcessLookupError, PermissionError):
+        return False
+
+def _wait_group(process: subprocess.Popen, deadline: float) -> bool:
+    """Wait for the leader and then the rest of its group until deadline, True when all of them exited."""
+    try:
+        process.wait(timeout=max(0, deadline - time.monotonic()))
+    except subprocess.TimeoutExpired:
+        return False
+    while _group_alive(process):
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+def terminate(process: subprocess.Popen, timeout: float = stop_timeout):
+    """
+    SIGTERM the process group, and SIGKILL it if anything in it is still alive after timeout seconds.
+    """
+    terminate_all([process], timeout)
+
+def kill(process: subprocess.Popen):
+    """SIGKILL the process group right away."""
+    terminate_all([process], 0)
+
+def terminate_all(processes: list[subprocess.Popen], timeout: float = stop_timeout):
+    """
+    Signal every group first and then wait on them against one deadline, so tearing down many takes as long as the
+    slowest one and never more than timeout.
+    """
+    if timeout > 0:
+        for process in processes:
+            _signal_group(process, signal.SIGTERM)
+    deadline = time.monotonic() + timeout
+    for process in processes:
+        if _wait_group(process, deadline):
+            continue
+        if timeout > 0:
+            logger.warning(f"Process group {process.pid} ({process.args[0]}) still running {timeout}s after SIGTERM, killing it")
+        _signal_group(process, signal.SIGKILL)
+        process.wait()
+    with _lock:
+        _groups.difference_update(processes)
+
+def shutdown():
+    """
+    Tear down every provider process group on interpreter exit, except those the state journal keeps for the next start.
+    """
+    with _lock:
+        running = [p for p in _groups if p.poll() is None or _group_alive(p)]
+    kept = [p for p in running if p.pid in keep]
+    running = [p for p in running if p.pid not in keep]
+    if kept:
+        logger.info(f"Leaving {len(kept)} tunnel processes running for the next start to adopt")
+    if running:
+        started = time.monotonic()
+        terminate_all(running, shutdown_timeout)
+        logger.info(f"Stopped {len(running)} provider process groups in {time.monotonic() - started:.2f}s")
+    for process in running:
+        remove_output(getattr(process, "output_path", None))
+
+atexit.register(shutdown)
+
+def _exit_on_sigterm(signum, frame):
+    sys.exit(128 + signum) # raises SystemExit, so atexit handlers (shutdown) run
+
+# a plain SIGTERM (docker stop, systemctl) skips atexit, servers like gunicorn install their own handler first
+if threading.current_thread() is threading.main_thread() and signal.getsignal(signal.SIGTERM) is signal.SIG_DFL:
+    signal.signal(signal.SIGTERM, _exit_on_sigterm)
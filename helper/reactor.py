@@ -0,0 +1,268 @@
+import ctypes
+import ctypes.util
+import os
+import selectors
+import struct
+import threading
+import time
+import logging
+from configuration import tunnel_output_max
+
+logger = logging.getLogger(__name__)
+
+chunk_size = 64 * 1024
+# only without inotify: seconds between reads of the output files while one had output or is new (starting processes
+# print their URL within new_tail seconds), doubling up to tail_interval_max while all of them are old and quiet
+tail_interval = 0.02
+tail_interval_max = 0.5
+new_tail = 10
+exit_check_interval = 1 # seconds between exit checks of a followed process the reactor can't watch through a pidfd
+
+IN_MODIFY = 0x00000002
+_inotify_event = struct.Struct("iIII") # wd, mask, cookie, length of the name that follows
+
+def _load_libc():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        libc.inotify_init1, libc.inotify_add_watch, libc.inotify_rm_watch
+        return libc
+    except (OSError, AttributeError):
+        return None # not Linux, the output files are polled
+
+_libc = _load_libc()
+
+class _Tail:
+    def __init__(self, fd, process, on_line, on_close):
+        self.fd = fd
+        self.path = process.output_path
+        self.process = process
+        self.on_line = on_line
+        self.on_close = on_close
+        self.buffer = b""
+        self.offset = 0
+        self.wd = None # inotify watch descriptor, None when the file has to be polled
+        self.added = time.monotonic()
+        self.checked = 0.0 # time.monotonic() of the last exit check
+
+class _Watch:
+    def __init__(self, process, on_exit):
+        self.process = process
+        self.on_exit = on_exit
+
+class OutputReactor:
+    """
+    One thread that reads the output of every tunnel child process.
+    Each process writes to a file of its own (processes.spawn_logged). The files are watched through one inotify
+    descriptor, so a write wakes the reactor at once, and read in large chunks that are split into lines here.
+    Each line is handed to on_line(str) and on_close() is called once the process has exited and its last lines are read.
+    It also watches child processes through pidfds, so a death is noticed the moment it happens.
+    Without inotify or pidfds (non-Linux, old kernels) the files and the processes are polled instead.
+    """
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        os.set_blocking(self._wake_w, False)
+        self.selector.register(self._wake_r, selectors.EVENT_READ, None)
+        self._inotify = self._open_inotify()
+        self._pending = [] # (fd, watch or tail) waiting to be registered by the reactor thread
+        self._tails = {} # fd -> _Tail, only used by the reactor thread
+        self._by_wd = {} # inotify watch descriptor -> [_Tail]
+        self._polled = {} # fd -> _Tail, those needing a poll for their output or their exit
+        self._watched = set() # processes with a pidfd watch
+        self._tail_wait = tail_interval
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _open_inotify(self) -> int | None:
+        if _libc is None:
+            return None
+        fd = _libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            logger.warning(f"inotify unavailable ({os.strerror(ctypes.get_errno())}), polling tunnel output files")
+            return None
+        self.selector.register(fd, selectors.EVENT_READ, self._inotify_events)
+        return fd
+
+    def follow(self, process, on_line, on_close=None, offset: int = None):
+        """
+        Read the output file of a process started with processes.spawn_logged from offset (its current end by default)
+        and hand each line to on_line(str), on_close() once the process has exited and its last lines are read.
+        """
+        fd = os.open(process.output_path, os.O_RDONLY)
+        tail = _Tail(fd, process, on_line, on_close)
+        tail.offset = os.lseek(fd, 0, os.SEEK_END) if offset is None else os.lseek(fd, offset, os.SEEK_SET)
+        self._add(fd, tail)
+
+    def watch_process(self, process, on_exit) -> bool:
+        """
+        Call on_exit(process) as soon as the process exits, after reaping it with process.poll().
+        Returns False when pidfds are not available (non-Linux, kernel < 5.3), its exit is then found by polling.
+        """
+        if not hasattr(os, "pidfd_open"):
+            return False
+        try:
+            fd = os.pidfd_open(process.pid)
+        except OSError:
+            return False
+        self._watched.add(process)
+        self._add(fd, _Watch(process, on_exit))
+        return True
+
+    def _add(self, fd: int, data):
+        with self._lock:
+            self._pending.append((fd, data))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="tunnel-output-reactor", daemon=True)
+                self._thread.start()
+        self._wake()
+
+    def _wake(self):
+        try:
+            os.write(self._wake_w, b"\0")
+        except BlockingIOError:
+            pass # already has a pending wake up
+
+    def _run(self):
+        while True:
+            for key, _ in self.selector.select(self._poll_wait()):
+                if key.data is None:
+                    self._register_pending()
+                elif isinstance(key.data, _Watch):
+                    self._reap(key.fd, key.data)
+                else:
+                    key.data()
+            if self._polled:
+                self._poll_tails()
+
+    def _poll_wait(self) -> float | None:
+        if not self._polled:
+            return None # everything is event driven
+        if any(tail.wd is None for tail in self._polled.values()):
+            return self._tail_wait
+        return exit_check_interval
+
+    def _register_pending(self):
+        try:
+            while os.read(self._wake_r, 4096):
+                pass
+        except BlockingIOError:
+            pass
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for fd, data in pending:
+            if isinstance(data, _Tail):
+                self._add_tail(data)
+            else:
+                self.selector.register(fd, selectors.EVENT_READ, data)
+
+    def _add_tail(self, tail: _Tail):
+        self._tails[tail.fd] = tail
+        if self._inotify is not None:
+            wd = _libc.inotify_add_watch(self._inotify, os.fsencode(tail.path), IN_MODIFY)
+            if wd >= 0:
+                tail.wd = wd
+                self._by_wd.setdefault(wd, []).append(tail)
+            else:
+                logger.warning(f"Unable to watch {tail.path} ({os.strerror(ctypes.get_errno())}), polling it")
+        if tail.wd is None or tail.process not in self._watched:
+            self._polled[tail.fd] = tail
+            self._tail_wait = tail_interval
+        self._read_tail(tail) # what it wrote before the watch was in place
+
+    def _inotify_events(self):
+        try:
+            data = os.read(self._inotify, chunk_size)
+        except BlockingIOError:
+            return
+        wds, offset = set(), 0
+        while offset < len(data):
+            wd, _, _, length = _inotify_event.unpack_from(data, offset)
+            wds.add(wd)
+            offset += _inotify_event.size + length
+        for wd in wds:
+            for tail in list(self._by_wd.get(wd, ())):
+                self._read_tail(tail)
+
+    def _reap(self, fd: int, watch: _Watch):
+        self.selector.unregister(fd)
+        os.close(fd)
+        self._watched.discard(watch.process)
+        watch.process.poll()
+        for tail in [t for t in self._tails.values() if t.process is watch.process]:
+            self._close_tail(tail) # its last lines before the exit handler
+        try:
+            watch.on_exit(watch.process)
+        except Exception as e:
+            logger.error(f"Process exit handler failed: {e}")
+
+    def _poll_tails(self):
+        active = False
+        now = time.monotonic()
+        for tail in list(self._polled.values()):
+            if tail.wd is None and (self._read_tail(tail) or now - tail.added < new_tail):
+                active = True
+            if tail.process in self._watched:
+                if tail.wd is not None:
+                    del self._polled[tail.fd] # its pidfd watch came in after it, nothing left to poll
+            elif now - tail.checked >= exit_check_interval:
+                tail.checked = now
+                if tail.process.poll() is not None:
+                    self._close_tail(tail)
+        self._tail_wait = tail_interval if active else min(tail_interval_max, self._tail_wait * 2)
+
+    def _read_tail(self, tail: _Tail) -> bool:
+        """Read what the file got since the last read, True when there was anything."""
+        read = False
+        while True:
+            try:
+                chunk = os.read(tail.fd, chunk_size)
+            except OSError:
+                chunk = b""
+            if not chunk:
+                break
+            read = True
+            tail.offset += len(chunk)
+            *lines, tail.buffer = (tail.buffer + chunk).split(b"\n")
+            for line in lines:
+                self._emit(tail, line)
+        if not read and not tail.buffer and tail.offset > tunnel_output_max:
+            self._truncate(tail)
+        return read
+
+    def _truncate(self, tail: _Tail):
+        # a line the child writes between the last read and this is lost, acceptable for a log
+        try:
+            os.truncate(tail.path, 0)
+        except OSError as e:
+            logger.warning(f"Unable to cut back output file {tail.path}: {e}")
+            return
+        tail.offset = os.lseek(tail.fd, 0, os.SEEK_SET)
+
+    def _close_tail(self, tail: _Tail):
+        self._read_tail(tail)
+        if tail.buffer:
+            self._emit(tail, tail.buffer)
+            tail.buffer = b""
+        del self._tails[tail.fd]
+        self._polled.pop(tail.fd, None)
+        if tail.wd is not None:
+            tails = self._by_wd[tail.wd]
+            tails.remove(tail)
+            if not tails:
+                del self._by_wd[tail.wd]
+                _libc.inotify_rm_watch(self._inotify, tail.wd)
+        os.close(tail.fd)
+        if tail.on_close:
+            try:
+                tail.on_close()
+            except Exception as e:
+                logger.error(f"Output close handler failed: {e}")
+
+    def _emit(self, tail: _Tail, line: bytes):
+        try:
+            tail.on_line(line.decode("utf-8", errors="replace").strip())
+        except Exception as e:
+            logger.error(f"Output line handler failed: {e}")
+
+reactor = OutputReactor()
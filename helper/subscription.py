@@ -1,29 +1,221 @@
 from __future__ import annotations
-from typing import TYPE_CHECKING, Union
+from typing import TYPE_CHECKING, Union, Callable
+import gzip
+import hashlib
+import hmac
+import threading
+import time
+from collections import deque
+from configuration import subscription_history, subscription_secret
+from v2ray import formats
+
+try:
+    import brotli # optional, pip install brotli
+except ImportError:
+    brotli = None
 
 if TYPE_CHECKING:
     from tunnels import Tunnel
 
 subscriptions = {}
+proxies = {} # same shape as subscriptions, holding V2Ray.to_proxy() taken when the url was published
+version = 0 # bumped on every change to subscriptions
+epoch = format(time.time_ns(), "x") # versions restart at 0 with the process, clients must match the epoch too
+history = deque(maxlen=subscription_history) # (version, added url or None, removed url or None)
+user_versions = {} # uuid -> version, bumped only when that user's URLs change
+_tokens = {} # per user token -> uuid
+_lock = threading.RLock()
+_snapshots = {} # (uuid or None for everyone, format) -> Snapshot
+
+# Content-Encoding -> compress(body), fast levels: a snapshot is compressed on every change that a client fetches
+compressors = {"gzip": lambda body: gzip.compress(body, compresslevel=6)}
+if brotli:
+    compressors["br"] = lambda body: brotli.compress(body, quality=5)
+
+def user_token(uuid: str) -> str:
+    """
+    Token of a user's own subscription link, an HMAC of the uuid so it is stable across restarts without storing it.
+    """
+    token = hmac.new(subscription_secret.encode(), uuid.encode(), hashlib.sha256).hexdigest()[:32]
+    with _lock:
+        _tokens[token] = uuid
+    return token
+
+def uuid_for_token(token: str) -> str | None:
+    with _lock:
+        return _tokens.get(token)
 
 def add_subscription(subscription: Tunnel):
+    global version
     uuid = subscription.v.uuid
     provider = subscription.provider_name
     url = subscription.url
 
-    if uuid not in subscriptions:
-        subscriptions[uuid] = {}
-    if subscription.public_url:
-        subscriptions[uuid][provider] = url
+    with _lock:
+        if uuid not in subscriptions:
+            subscriptions[uuid] = {}
+            proxies[uuid] = {}
+            user_token(uuid)
+        previous = subscriptions[uuid].get(provider)
+        if subscription.public_url and previous != url:
+            subscriptions[uuid][provider] = url
+            proxies[uuid][provider] = subscription.v.to_proxy()
+            version += 1
+            user_versions[uuid] = user_versions.get(uuid, 0) + 1
+            history.append((version, url, previous))
 
 def remove_subscription(subscription: Tunnel):
+    global version
     uuid = subscription.v.uuid
     provider = subscription.provider_name
 
-    if uuid in subscriptions and provider in subscriptions[uuid]:
-        del subscriptions[uuid][provider]
-        if not subscriptions[uuid]:
-            del subscriptions[uuid]
-    
+    with _lock:
+        if uuid in subscriptions and provider in subscriptions[uuid]:
+            removed = subscriptions[uuid].pop(provider)
+            del proxies[uuid][provider]
+            if not subscriptions[uuid]:
+                del subscriptions[uuid]
+                del proxies[uuid]
+            version += 1
+            user_versions[uuid] = user_versions.get(uuid, 0) + 1
+            history.append((version, None, removed))
+
+def export_state() -> dict:
+    """
+    Everything needed to serve the subscription, as JSON compatible data, for follower workers (see cluster).
+    """
+    with _lock:
+        return {
+            "epoch": epoch,
+            "version": version,
+            "subscriptions": {uuid: dict(urls) for uuid, urls in subscriptions.items()},
+            "proxies": {uuid: dict(entries) for uuid, entries in proxies.items()},
+            "user_versions": dict(user_versions),
+            "history": list(history),
+            "users": list(_tokens.values()),
+        }
+
+def load_state(state: dict):
+    """
+    Replace the subscription with one exported by export_state in the leader process.
+    """
+    global version, epoch
+    with _lock:
+        if state["epoch"] != epoch:
+            _snapshots.clear() # versions of another epoch say nothing about the cached snapshots
+        epoch, version = state["epoch"], state["version"]
+        for mine, theirs in ((subscriptions, state["subscriptions"]), (proxies, state["proxies"]), (user_versions, state["user_versions"])):
+            mine.clear()
+            mine.update(theirs)
+        history.clear()
+        history.extend(tuple(change) for change in state["history"])
+        for uuid in state["users"]:
+            user_token(uuid)
+
+def reset_state():
+    """
+    Start over with an empty subscription in a new epoch, for a follower taking over as leader: what it loaded
+    from the previous leader is only published again once the tunnels are restored.
+    """
+    global version, epoch
+    with _lock:
+        epoch = format(time.time_ns(), "x")
+        version = 0
+        for mine in (subscriptions, proxies, user_versions, _snapshots):
+            mine.clear()
+        history.clear()
+
+class Snapshot:
+    """
+    Immutable rendering of the subscription at one version, with its strong ETag.
+    Each compressed body is made the first time a client asks for that encoding, then reused for the version.
+    """
+    def __init__(self, version: int, body: bytes):
+        self.version = version
+        self.body = body
+        self.etag = hashlib.sha256(body).hexdigest()[:32]
+        self.encoded = {} # Content-Encoding -> compressed body
+        self._lock = threading.Lock()
+
+    def encoding_for(self, accept_encodings) -> str | None:
+        """Best encoding the client accepts (werkzeug Accept header), None for identity."""
+        for encoding in ("br", "gzip"):
+            if encoding in compressors and accept_encodings[encoding]:
+                return encoding
+        return None
+
+    def encode(self, encoding: str) -> bytes:
+        """The body compressed with encoding, compressed once per snapshot."""
+        encoded = self.encoded.get(encoding)
+        if encoded is None:
+            with self._lock: # concurrent first requests compress once
+                encoded = self.encoded.get(encoding)
+                if encoded is None:
+                    encoded = self.encoded[encoding] = compressors[encoding](self.body)
+        return encoded
+
+def subscription_urls() -> list[str]:
+    with _lock:
+        return [url for p in subscriptions.values() for url in p.values()]
+
+def changes_since(since_version: int, since_epoch: str = None) -> dict:
+    """
+    URLs added and removed after since_version, netted out so a URL added then removed again does not show up.
+    Falls back to the full list ("full": True) when the version is unknown: another epoch, from the future,
+    or older than the history kept.
+    """
+    with _lock:
+        result = {"epoch": epoch, "version": version}
+        oldest = history[0][0] if history else version + 1
+        if since_epoch != epoch or since_version > version or (since_version < version and oldest > since_version + 1):
+            return {**result, "full": True, "urls": subscription_urls()}
+        added, removed = {}, {} # dicts keep the order of the changes
+        for change_version, add, remove in history:
+            if change_version <= since_version:
+                continue
+            if remove:
+                if remove in added:
+                    del added[remove]
+                else:
+                    removed[remove] = None
+            if add:
+                if add in removed:
+                    del removed[add]
+                else:
+                    added[add] = None
+        return {**result, "full": False, "added": list(added), "removed": list(removed)}
 
+def subscription_entries(uuid: str = None) -> list[tuple[str, dict]]:
+    """
+    (url, proxy) of every published tunnel, or of one user's
+    """
+    with _lock:
+        users = [uuid] if uuid is not None else list(subscriptions)
+        return [
+            (url, proxies[u][provider])
+            for u in users for provider, url in subscriptions.get(u, {}).items()
+        ]
 
+def get_snapshot(render: Callable[[str], str], fmt: str = "raw", uuid: str = None) -> Snapshot:
+    """
+    Current snapshot in a format, rebuilt only when add_subscription/remove_subscription changed something since the last one.
+    With a uuid only that user's URLs are included and only that user's changes rebuild it.
+    "raw" is the newline joined URLs passed through render, the others are encoders from v2ray.formats.
+    """
+    key = (uuid, fmt)
+    with _lock:
+        current_version = version if uuid is None else user_versions.get(uuid, 0)
+        cached = _snapshots.get(key)
+        if cached is not None and cached.version == current_version:
+            return cached
+        entries = subscription_entries(uuid)
+    if fmt == "raw":
+        text = render("\n".join(url for url, _ in entries))
+    else:
+        text = formats.encoders[fmt][0](entries)
+    snapshot = Snapshot(current_version, text.encode("utf-8"))
+    with _lock:
+        cached = _snapshots.get(key)
+        if cached is None or cached.version < snapshot.version:
+            _snapshots[key] = snapshot
+    return snapshot
@@ -0,0 +1,117 @@
+from __future__ import annotations
+import json
+import logging
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Optional
+from configuration import state_db
+from helper import processes
+
+if TYPE_CHECKING:
+    from tunnels import Tunnel
+
+logger = logging.getLogger(__name__)
+
+schema = """
+CREATE TABLE IF NOT EXISTS tunnels (
+    url TEXT NOT NULL,              -- V2Ray url as configured
+    provider TEXT NOT NULL,
+    pid INTEGER,                    -- NULL while the tunnel waits for a restart
+    pid_start INTEGER,              -- start time of pid, tells it apart from a later process reusing the pid
+    args TEXT,                      -- JSON command line
+    public_url TEXT,
+    tun_start_time REAL,
+    tun_end_time REAL,
+    updated REAL NOT NULL,
+    output TEXT,                    -- file the process writes its output to, followed again after adopting it
+    PRIMARY KEY (url, provider)
+)
+"""
+
+@dataclass
+class Record:
+    url: str
+    provider: str
+    pid: Optional[int]
+    pid_start: Optional[int]
+    args: list
+    public_url: Optional[str]
+    tun_start_time: Optional[float]
+    tun_end_time: Optional[float]
+    output: Optional[str]
+
+class Journal:
+    """
+    SQLite record of every tunnel that should be running: its provider process, public URL, start and expiry time.
+    Written on every state change of a tunnel, read on boot to adopt the processes that outlived the previous run.
+    A row stays while the tunnel waits for a restart (pid NULL) and goes when the tunnel is stopped on purpose.
+    Only processes writing to an output file (processes.spawn_logged) are recorded with their pid and left running,
+    one writing to a pipe would lose it with the app.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(schema)
+        if "output" not in [column[1] for column in self._db.execute("PRAGMA table_info(tunnels)")]:
+            self._db.execute("ALTER TABLE tunnels ADD COLUMN output TEXT") # journals written before the column
+        self._kept = {} # (url, provider) -> pid in processes.keep
+        self._lock = threading.Lock()
+
+    def _execute(self, sql: str, params: tuple = ()) -> list:
+        # a journal that can't be written must not break starting or stopping tunnels
+        try:
+            return self._db.execute(sql, params).fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"State journal {self.path}: {e}")
+            return []
+
+    def _keep(self, key: tuple, pid: int | None):
+        processes.keep.discard(self._kept.pop(key, None))
+        if pid:
+            self._kept[key] = pid
+            processes.keep.add(pid)
+
+    def save(self, tunnel: Tunnel):
+        process = tunnel.process
+        output = getattr(process, "output_path", None)
+        pid = process.pid if output and process.poll() is None else None
+        pid_start = processes.start_time(pid) if pid else None
+        if pid_start is None:
+            pid = None
+        args = json.dumps([str(a) for a in process.args]) if pid else None
+        key = (tunnel.config.url, tunnel.config.provider_name)
+        with self._lock:
+            self._execute(
+                "INSERT OR REPLACE INTO tunnels VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (*key, pid, pid_start, args, tunnel.provider_instance.tunnel_url if pid else None,
+                 tunnel.tun_start_time, tunnel.tun_end_time, time.time(), output if pid else None)
+            )
+            self._keep(key, pid)
+
+    def forget(self, url: str, provider: str):
+        """Drop a tunnel's row, once it is stopped on purpose."""
+        with self._lock:
+            self._execute("DELETE FROM tunnels WHERE url = ? AND provider = ?", (url, provider))
+            self._keep((url, provider), None)
+
+    def records(self) -> list[Record]:
+        with self._lock:
+            rows = self._execute(
+                "SELECT url, provider, pid, pid_start, args, public_url, tun_start_time, tun_end_time, output FROM tunnels"
+            )
+        return [Record(*row[:4], json.loads(row[4]) if row[4] else [], *row[5:]) for row in rows]
+
+def _open() -> Journal | None:
+    if not state_db:
+        return None
+    try:
+        return Journal(state_db)
+    except sqlite3.Error as e:
+        logger.error(f"Unable to open state journal {state_db}, tunnels will not survive a restart: {e}")
+        return None
+
+journal = _open()
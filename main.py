@@ -1,21 +1,25 @@
 import logging
-from configuration import api_password, subscription_password, tunnel_urls, setup_logging, custom_frontend, mode
+from configuration import api_password, subscription_password, tunnel_urls, setup_logging, custom_frontend, mode, event_stream_timeout
 setup_logging()  # Initialize logging configuration
 logger = logging.getLogger(__name__)
 
-from tunnels import providers, Tunnel
-from helper.subscription import subscriptions
+from tunnels import providers, Tunnel, startup_report
+from helper.subscription import subscriptions, get_snapshot, changes_since, user_token, uuid_for_token, export_state, load_state, reset_state
+import helper.subscription
 from helper.error import api_error_stopping_tunnel
-import concurrent.futures
+from helper import metrics, events
+from v2ray import formats
 import flask
 from flask import session, request, redirect, url_for, flash
 import json
 import os
 import datetime
+import time
 from routes.log import log_bp
 from routes.auth import login_required
 from flask_apscheduler import APScheduler
-from tunnelmgr import stop_one_tunnel, reset_one_tunnel, tunnels, tun_tasks, prepare_tunnels
+from cluster import cluster
+from tunnelmgr import stop_one_tunnel, reset_one_tunnel, tunnels, registry, prepare_tunnels, restore_tunnels, start_tunnels, bulk_tunnels, bulk_actions
 
 # tunnels = tunnel_urls
 
@@ -27,36 +31,72 @@ app.config["SCHEDULER_API_ENABLED"] = True
 # scheduler = APScheduler()
 from jobs import scheduler
 scheduler.init_app(app)
-scheduler.start()
+if mode != "prod":
+    scheduler.start() # under gunicorn only the leader worker runs it, see lead()
 
 @app.route('/favicon.ico')
 def fav():
     return flask.send_from_directory(os.path.join(app.root_path, 'static'),'favicon.ico')
 
-# tun_tasks = [] # this is what we do for CRUD
+# registry holds every tunnel, addressed by its stable id
 
 my_providers = [
     {"id": i, "provider": p, "user_enabled": True} for i, p in enumerate(providers)
 ]
 
-# https://stackoverflow.com/a/53112659
-def is_jsonable(x):
-    try:
-        json.dumps(x)
-        return True
-    except (TypeError, OverflowError):
-        return False
-
-
-def serialize(obj):
-    obj_dict = obj.__dict__.copy()
-    serialized_dict = {}
-    for k in obj_dict:
-        if is_jsonable(obj_dict[k]):
-            serialized_dict[k] = obj_dict[k]
-        else:
-            serialized_dict[k] = type(obj_dict[k]).__name__
-    return serialized_dict
+def tunnels_json(tunnels) -> str:
+    """JSON array of tunnels, joined from each tunnel's cached encoding."""
+    return "[" + ",".join(t.to_json() for t in tunnels) + "]"
+
+events.bus.serializers["tunnel"] = lambda tunnel: tunnel.to_json()
+
+def sse(event_type: str, data, event_id: int = None) -> str:
+    """One Server-Sent Event, data is JSON encoded unless it already is a string."""
+    head = f"id: {event_id}\n" if event_id else ""
+    return f"{head}event: {event_type}\ndata: {data if isinstance(data, str) else json.dumps(data)}\n\n"
+
+# endpoints a follower worker serves itself from the shared store, every other request goes to the leader
+follower_endpoints = {
+    "static", "fav", "index", "dashboard", "login", "logout",
+    "get_tunnels", "tunnel_events", "subscription", "user_subscription", "subscription_delta",
+}
+
+@app.before_request
+def forward_to_leader():
+    if cluster.is_leader or request.endpoint is None:
+        return None
+    if request.endpoint in follower_endpoints or request.blueprint == log_bp.name: # the log file is shared
+        cluster.refresh()
+        return None
+    status, headers, body = cluster.forward(
+        request.method, request.full_path, list(request.headers.items()), request.get_data(), request.root_url
+    )
+    return flask.Response(body, status=status, headers=headers)
+
+def lead():
+    """
+    Make this process the one owning the tunnels: run the scheduler and take over the tunnels of the previous run.
+    """
+    if not scheduler.running:
+        scheduler.start()
+    reset_state() # a follower taking over holds the previous leader's subscription, dead URLs included
+    prepare_tunnels()
+    restore_tunnels()
+
+def shared_state() -> dict:
+    """What the leader publishes for followers to serve."""
+    return {"tunnels": tunnels_json(registry), "subscription": json.dumps(export_state())}
+
+def shared_version() -> tuple:
+    """Changes whenever shared_state() would, checked often by the leader so it only publishes what changed."""
+    return helper.subscription.epoch, helper.subscription.version, registry.changes()
+
+def run_forwarded(method: str, path: str, headers: list, body: bytes, base_url: str) -> tuple[int, list, bytes]:
+    """Answer a request a follower forwarded, as if it was made to this process."""
+    response = app.test_client(use_cookies=False).open(path, method=method, headers=headers, data=body, base_url=base_url)
+    return response.status_code, list(response.headers.items()), response.get_data()
+
+cluster.on_update["subscription"] = lambda value: load_state(json.loads(value))
 
 # Start or restart tunnels
 
@@ -66,13 +106,13 @@ def reset_tunnels(scope:str="all"):
     """
     # stop tunnels
     if scope == "all":
-        provider_to_reset = providers
+        provider_to_reset = list(providers) # a provider that fails to load removes itself from the list
     elif scope == "enabled":
-        provider_to_reset = [p['provider'] for p in my_providers if p["user_enabled"]]
+        provider_to_reset = [p['provider'] for p in my_providers if p["user_enabled"] and p['provider'] in providers]
+    # providers are manifest specs until first used, so match on names rather than classes
+    names_to_reset = {p.__name__ for p in provider_to_reset}
 
-    for tunnel in tun_tasks:
-        if tunnel.provider_instance.__class__ not in provider_to_reset:
-            continue
+    for tunnel in [t for name in names_to_reset for t in registry.by_provider(name)]:
         try:
             tunnel.stop()
         except Exception as e:
@@ -81,6 +121,8 @@ def reset_tunnels(scope:str="all"):
     for tunnel in tunnels:
         for provider in provider_to_reset:
             logger.info(f"Starting tunnel {tunnel} with provider {provider.__name__}")
+            if registry.find(tunnel, provider.__name__):
+                continue
             try:
                 tunnel_instance = Tunnel(
                     url=tunnel,
@@ -89,15 +131,9 @@ def reset_tunnels(scope:str="all"):
             except Exception as e:
                 logger.error(f"Error starting tunnel: {e}")
                 continue
-            if tunnel_instance in tun_tasks:
-                continue
-            else:
-                tun_tasks.append(tunnel_instance)
-    allowed_tun_tasks = [t for t in tun_tasks if t.provider_instance.__class__ in provider_to_reset]
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        futures = {executor.submit(tunnel.start): tunnel for tunnel in allowed_tun_tasks}
-        for f in concurrent.futures.as_completed(futures):
-            tunnel = futures[f]
+            registry.add(tunnel_instance)
+    to_start = [t for name in names_to_reset for t in registry.by_provider(name)]
+    start_tunnels(to_start)
 
 @app.get("/")
 def index():
@@ -118,13 +154,13 @@ def get_providers():
             "id": provider["id"],
             "provider": provider["provider"].__name__,
             "user_enabled": provider["user_enabled"]
-        } for provider in my_providers
+        } for provider in my_providers if provider["provider"] in providers # dropped ones failed to load
     ]
     return flask.jsonify(serialized_providers)
 
 @app.post(f"/{api_password}/providers/<int:provider_id>")
 def toggle_provider(provider_id):
-    if provider_id < 0 or provider_id >= len(my_providers):
+    if provider_id < 0 or provider_id >= len(my_providers) or my_providers[provider_id]["provider"] not in providers:
         return flask.jsonify(
             {
                 "msg": "Provider not found",
@@ -144,13 +180,17 @@ def toggle_provider(provider_id):
 @app.get(f"/{api_password}/tunnels/<int:tunnel_id>")
 def get_tunnel(tunnel_id):
     """
-    Get tunnel information by ID
+    Get tunnel information by ID, with the last ?lines= log lines or every line after ?after=<log_offset>
     """
-    if tunnel_id < 0 or tunnel_id >= len(tun_tasks):
+    tunnel = registry.get(tunnel_id)
+    if tunnel is None:
         return flask.jsonify({"msg": "Tunnel not found", "code": "error"}), 404
-    tunnel = tun_tasks[tunnel_id]
+    logs, log_offset = tunnel.get_logs(
+        lines=request.args.get("lines", 100, type=int),
+        after=request.args.get("after", type=int)
+    )
     return flask.jsonify(
-        serialize(tunnel)
+        {**tunnel.to_dict(), "logs": logs, "log_offset": log_offset}
     )
 
 @app.get(f"/{api_password}/tunnels")
@@ -158,9 +198,8 @@ def get_tunnels():
     """
     Get all tunnels information
     """
-    return flask.jsonify(
-        [{"id": i, **serialize(t)} for i, t in enumerate(tun_tasks)]
-    ), 200
+    body = tunnels_json(registry) if cluster.is_leader else cluster.values.get("tunnels", "[]")
+    return flask.Response(body, mimetype="application/json"), 200
 
 
 # Remove Tunnels
@@ -169,14 +208,14 @@ def delete_tunnel(tunnel_id):
     """
     Stop a specific tunnel by ID
     """
-    if tunnel_id < 0 or tunnel_id >= len(tun_tasks):
+    tunnel = registry.get(tunnel_id)
+    if tunnel is None:
         return flask.jsonify(
             {
                 "msg": "Tunnel not found",
                 "code": "error"
             }
         ), 404
-    tunnel = tun_tasks[tunnel_id]
     try:
         stop_one_tunnel(tunnel)
         return flask.jsonify(
@@ -194,28 +233,42 @@ def delete_tunnel(tunnel_id):
             }
         ), 500
 
-@app.delete(f"/{api_password}/tunnels/all")
-def delete_all_tunnels():
+def bulk_response(action: str, results: list[dict]):
     """
-    Fully stop all tunnels
+    200 when every tunnel succeeded, 207 with the per tunnel results otherwise.
     """
-    for tunnel in tun_tasks:
-        try:
-            stop_one_tunnel(tunnel)
-        except Exception as e:
-            return flask.jsonify(
-                {
-                    "msg": "Unable to remove all tunnels. Check program logs.",
-                    "details": str(e),
-                    "code": "error"
-                }
-            ), 500
+    failed = sum(1 for r in results if r["code"] != "success")
     return flask.jsonify(
         {
-            "msg": "All tunnels stopped and removed",
-            "code": "success"
+            "msg": f"{action}: {len(results) - failed} succeeded, {failed} failed",
+            "code": "error" if failed else "success",
+            "results": results
         }
-    ), 200
+    ), 207 if failed else 200
+
+@app.delete(f"/{api_password}/tunnels/all")
+def delete_all_tunnels():
+    """
+    Fully stop all tunnels, concurrently, reporting each one
+    """
+    return bulk_response("stop", bulk_tunnels("stop", [t.id for t in registry]))
+
+@app.post(f"/{api_password}/tunnels/bulk")
+def bulk_tunnel_action():
+    """
+    Stop, start or reset many tunnels concurrently, {"action": "stop" | "start" | "reset", "ids": [0, 1, ...]}.
+    Without ids the action applies to every tunnel.
+    """
+    request_data = flask.request.get_json(silent=True) or {}
+    action = request_data.get("action")
+    ids = request_data.get("ids")
+    if action not in bulk_actions:
+        return flask.jsonify({"msg": f"Unknown action {action}, use one of {', '.join(bulk_actions)}", "code": "error"}), 400
+    if ids is None:
+        ids = [t.id for t in registry]
+    elif not isinstance(ids, list) or not all(isinstance(i, int) for i in ids):
+        return flask.jsonify({"msg": "ids must be a list of tunnel ids", "code": "error"}), 400
+    return bulk_response(action, bulk_tunnels(action, ids))
 
 # Reset Tunnels (remove and start again)
 @app.post(f"/{api_password}/tunnels/<int:tunnel_id>")
@@ -223,10 +276,10 @@ def reset_tunnel(tunnel_id):
     """
     Reset a specific tunnel by ID
     """
-    if tunnel_id < 0 or tunnel_id >= len(tun_tasks):
+    tunnel = registry.get(tunnel_id)
+    if tunnel is None:
         return flask.jsonify({"error": "Tunnel not found"}), 404
-    tunnel = tun_tasks[tunnel_id]
-    provider_name = tunnel.provider_instance.__class__.__name__
+    provider_name = tunnel.provider_name
     try:
         tunnel.stop()
     except Exception as e:
@@ -278,9 +331,9 @@ def update_tunnel_timer(tunnel_id):
     """
     Update the expiry timer for a specific tunnel by ID
     """
-    if tunnel_id < 0 or tunnel_id >= len(tun_tasks):
+    tunnel = registry.get(tunnel_id)
+    if tunnel is None:
         return flask.jsonify({"msg": "Tunnel not found", "code": "error"}), 404
-    tunnel = tun_tasks[tunnel_id]
     request_data = flask.request.get_json()
     expire = request_data.get("expire")
     expire = int(expire) # time in minutes
@@ -292,6 +345,7 @@ def update_tunnel_timer(tunnel_id):
             return flask.jsonify({"msg": f"Error removing expiry job: {str(e)}", "code": "error"}), 500
         tunnel.tun_end_time = None
         tunnel.expire_job = None
+        tunnel.changed()
         return flask.jsonify({"msg": "Expiry removed, tunnel set to never expire", "code": "success"}), 200
     if tunnel.expire_job:
         try:
@@ -301,6 +355,7 @@ def update_tunnel_timer(tunnel_id):
         except Exception as e:
             return flask.jsonify({"msg": f"Error modifying expiry job: {str(e)}", "code": "error"}), 500
         tunnel.tun_end_time = (datetime.datetime.now() + datetime.timedelta(minutes=expire)).timestamp()
+        tunnel.changed()
         return flask.jsonify({"msg": "Expiry updated", "code": "success"}), 200
     else:
         # Create a new expiry job
@@ -313,10 +368,91 @@ def update_tunnel_timer(tunnel_id):
             )
             tunnel.expire_job = job
             tunnel.tun_end_time = expire_time.timestamp()
+            tunnel.changed()
             return flask.jsonify({"msg": "Expiry set", "code": "success"}), 200
         except Exception as e:
             return flask.jsonify({"msg": f"Error creating expiry job: {str(e)}", "code": "error"}), 500
 
+@app.get(f"/{api_password}/events")
+def tunnel_events():
+    """
+    Server-Sent Events stream for the dashboard: a "snapshot" of every tunnel on connect,
+    then a "tunnel" event with the new state of a tunnel whenever it starts, stops, rotates or its expiry changes.
+    The stream ends after EVENT_STREAM_TIMEOUT seconds, EventSource reconnects by itself and gets a new snapshot.
+    """
+    if not cluster.is_leader:
+        return flask.Response(follower_stream(), mimetype="text/event-stream", headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        })
+
+    def stream():
+        subscription = events.bus.subscribe() # before the snapshot, so no change falls in between
+        try:
+            yield "retry: 3000\n\n"
+            yield sse("snapshot", tunnels_json(registry))
+            deadline = time.monotonic() + event_stream_timeout
+            while time.monotonic() < deadline:
+                event = subscription.get(timeout=15)
+                if subscription.overflowed:
+                    subscription.overflowed = False
+                    yield sse("snapshot", tunnels_json(registry))
+                elif event is None:
+                    yield ": keepalive\n\n"
+                else:
+                    event_id, event_type, data = event
+                    yield sse(event_type, data, event_id)
+        finally:
+            events.bus.unsubscribe(subscription)
+
+    return flask.Response(stream(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no", # nginx would otherwise hold the events back
+    })
+
+def follower_stream():
+    """
+    The event stream on a follower worker: a new snapshot whenever the leader publishes a changed tunnel list.
+    """
+    yield "retry: 3000\n\n"
+    last = cluster.values.get("tunnels", "[]")
+    yield sse("snapshot", last)
+    deadline = time.monotonic() + event_stream_timeout
+    keepalive = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        time.sleep(1)
+        cluster.refresh()
+        current = cluster.values.get("tunnels", "[]")
+        if current != last:
+            last = current
+            yield sse("snapshot", current)
+        elif time.monotonic() >= keepalive:
+            yield ": keepalive\n\n"
+        else:
+            continue
+        keepalive = time.monotonic() + 15
+
+@app.get(f"/{api_password}/metrics")
+def get_metrics():
+    """
+    Per-provider tunnel metrics, e.g. time taken for the public URL to show up, and the startup timing report
+    """
+    return flask.jsonify({**metrics.snapshot(), "startup": startup_report()})
+
+@app.get(f"/{api_password}/subscriptions")
+def get_subscriptions():
+    """
+    Per user subscription links, one for every uuid in TUNNEL_URLS
+    """
+    users = registry.uuids()
+    return flask.jsonify([
+        {
+            "uuid": uuid,
+            "url": url_for("user_subscription", token=user_token(uuid), _external=True),
+            "tunnels": len(subscriptions.get(uuid, {})),
+        } for uuid in users
+    ])
+
 @app.route(f"/{api_password}/dashboard")
 @login_required
 def dashboard():
@@ -347,19 +483,71 @@ def logout():
     flash('You have been logged out.', 'info')
     return redirect(url_for('login'))
 
-@app.get(f"/{subscription_password}/subscription")
-def subscription():
-    subscription_list = [url for p in subscriptions.values() for url in p.values()]
-    subscription_content = "\n".join(subscription_list)
+def render_subscription(content: str) -> str:
     return flask.render_template(
         "subscription.txt",
-        content=subscription_content
+        content=content
     )
 
-# gunicorn entry point
+def serve_subscription(uuid: str = None):
+    """
+    Served from a snapshot that is only rebuilt when the subscription (or this user's part of it) changes.
+    Clients sending If-None-Match with the current ETag get a 304, bodies are compressed once per version and encoding.
+    ?format= picks the output: raw (default), base64 (v2rayN), clash (Clash/Mihomo) or singbox.
+    """
+    fmt = request.args.get("format", "raw")
+    if fmt != "raw" and fmt not in formats.encoders:
+        return flask.Response(f"Unknown format {fmt}, use raw, {', '.join(formats.encoders)}\n", status=400, mimetype="text/plain")
+    snapshot = get_snapshot(render_subscription, fmt, uuid)
+    if request.if_none_match.contains(snapshot.etag):
+        response = flask.Response(status=304)
+    else:
+        encoding = snapshot.encoding_for(request.accept_encodings)
+        response = flask.Response(snapshot.encode(encoding) if encoding else snapshot.body)
+        if fmt != "raw":
+            response.headers["Content-Type"] = formats.encoders[fmt][1]
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+    response.set_etag(snapshot.etag)
+    if uuid is None:
+        response.headers["X-Subscription-Version"] = f"{helper.subscription.epoch}:{snapshot.version}" # for the delta endpoint
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Cache-Control"] = "no-cache" # always revalidate, it is cheap
+    return response
+
+@app.get(f"/{subscription_password}/subscription")
+def subscription():
+    return serve_subscription()
+
+@app.get("/sub/<token>")
+def user_subscription(token):
+    """
+    One user's own subscription, only the tunnels of their uuid. Links are listed by GET /<api>/subscriptions.
+    """
+    uuid = uuid_for_token(token)
+    if uuid is None:
+        return flask.Response("Not found\n", status=404, mimetype="text/plain")
+    return serve_subscription(uuid)
+
+@app.get(f"/{subscription_password}/subscription/delta")
+def subscription_delta():
+    """
+    ?since=<epoch>:<version> as returned in X-Subscription-Version or by a previous delta.
+    Returns the URLs added and removed since then, or the full list with "full": true when that version is no longer known.
+    """
+    since_epoch, _, since_version = request.args.get("since", "").rpartition(":")
+    try:
+        since_version = int(since_version)
+    except ValueError:
+        return flask.jsonify({"error": "since must be <epoch>:<version>"}), 400
+    delta = changes_since(since_version, since_epoch)
+    delta["since"] = f"{delta['epoch']}:{delta['version']}" # pass back as ?since= next time
+    return flask.jsonify(delta)
+
+# gunicorn entry point, every worker runs this and one of them becomes the leader
 if mode == "prod":
-    prepare_tunnels()
+    cluster.start(lead, shared_state, shared_version, run_forwarded)
 
 if __name__ == "__main__":
-    prepare_tunnels()
+    cluster.start(lead, shared_state, shared_version, run_forwarded)
     app.run(host="0.0.0.0", port=5000, debug=True, use_reloader=False) 
\ No newline at end of file
@@ -0,0 +1,90 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from helper import metrics
+
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    """
+    rate tokens per second, at most burst saved up. A reservation always takes a token, when none is left the
+    count goes negative and the caller is told how long to wait, so waiting callers are served in order.
+    """
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take a token, returns the seconds to wait before using it (0 when one was available)."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+class StartScheduler:
+    """
+    Paces process starts per provider class by its start_rate (starts per second) and start_burst,
+    <PROVIDER>_START_RATE and <PROVIDER>_START_BURST override them. Providers without a start_rate start right away.
+    A provider's restart_delay (<PROVIDER>_RESTART_DELAY) also holds back any start until that many seconds after the
+    last stop of one of its processes, for services that need the previous session closed before a new one.
+    Shared by tunnel starts, resets and standby refills, so a burst of them runs as fast as the provider allows.
+    """
+    def __init__(self):
+        self._buckets = {} # provider class -> TokenBucket
+        self._stopped = {} # provider class -> time.monotonic() of the last stop
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def limits_for(provider_class) -> tuple[float | None, int]:
+        name = provider_class.__name__.upper()
+        rate = os.getenv(f"{name}_START_RATE")
+        burst = os.getenv(f"{name}_START_BURST")
+        return (
+            float(rate) if rate is not None else getattr(provider_class, "start_rate", None),
+            int(burst) if burst is not None else getattr(provider_class, "start_burst", 1),
+        )
+
+    @staticmethod
+    def restart_delay_for(provider_class) -> float:
+        delay = os.getenv(f"{provider_class.__name__.upper()}_RESTART_DELAY")
+        return float(delay) if delay is not None else getattr(provider_class, "restart_delay", 0)
+
+    def stopped(self, provider_class):
+        """Note that a process of the provider stopped or died, later starts keep its restart_delay from now."""
+        with self._lock:
+            self._stopped[provider_class] = time.monotonic()
+
+    def reserve(self, provider_class) -> float:
+        """Book the next start of a provider, returns the seconds to wait before starting it."""
+        with self._lock:
+            if provider_class not in self._buckets:
+                rate, burst = self.limits_for(provider_class)
+                self._buckets[provider_class] = TokenBucket(rate, max(1, burst)) if rate else None
+            bucket = self._buckets[provider_class]
+            stopped = self._stopped.get(provider_class)
+        delay = bucket.reserve() if bucket else 0.0
+        if stopped is not None:
+            delay = max(delay, stopped + self.restart_delay_for(provider_class) - time.monotonic())
+        if delay:
+            logger.debug(f"{provider_class.__name__} start queued for {delay:.2f}s by its start rate or restart delay")
+            metrics.observe("start_queue_wait", provider_class.__name__, delay)
+        return delay
+
+    def wait(self, provider_class):
+        delay = self.reserve(provider_class)
+        if delay:
+            time.sleep(delay)
+
+    async def wait_async(self, provider_class):
+        delay = self.reserve(provider_class)
+        if delay:
+            await asyncio.sleep(delay)
+
+start_scheduler = StartScheduler()
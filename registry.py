@@ -0,0 +1,86 @@
+from __future__ import annotations
+import itertools
+import threading
+from typing import TYPE_CHECKING, Iterator, Optional
+
+if TYPE_CHECKING:
+    from tunnels import Tunnel
+
+class TunnelRegistry:
+    """
+    Every Tunnel the app manages, under an id that never changes or gets reused.
+    Indexed by id, by (V2Ray url as configured, provider name), by provider name and by uuid, all O(1).
+    Iterating gives the tunnels in the order they were added.
+    """
+    def __init__(self):
+        self._ids = itertools.count()
+        self._by_id = {} # id -> Tunnel
+        self._by_key = {} # (url, provider name) -> Tunnel
+        self._by_provider = {} # provider name -> {id: Tunnel}
+        self._by_uuid = {} # uuid -> {id: Tunnel}
+        self._added_or_removed = 0
+        self._lock = threading.Lock()
+
+    def add(self, tunnel: Tunnel) -> int:
+        """
+        Register a tunnel and set its id, returns the id. Raises ValueError if the url/provider pair is already registered.
+        """
+        key = (tunnel.config.url, tunnel.config.provider_name) # tunnel.url changes once started, its config does not
+        with self._lock:
+            if key in self._by_key:
+                raise ValueError(f"{tunnel.provider_name} tunnel for {tunnel.url} is already registered")
+            tunnel.id = next(self._ids)
+            self._added_or_removed += 1
+            self._by_id[tunnel.id] = tunnel
+            self._by_key[key] = tunnel
+            self._by_provider.setdefault(tunnel.config.provider_name, {})[tunnel.id] = tunnel
+            self._by_uuid.setdefault(tunnel.config.uuid, {})[tunnel.id] = tunnel
+        return tunnel.id
+
+    def remove(self, tunnel_id: int) -> Optional[Tunnel]:
+        with self._lock:
+            tunnel = self._by_id.pop(tunnel_id, None)
+            if tunnel is None:
+                return None
+            self._added_or_removed += 1
+            config = tunnel.config
+            del self._by_key[(config.url, config.provider_name)]
+            for index, name in ((self._by_provider, config.provider_name), (self._by_uuid, config.uuid)):
+                del index[name][tunnel_id]
+                if not index[name]:
+                    del index[name]
+        return tunnel
+
+    def get(self, tunnel_id: int) -> Optional[Tunnel]:
+        return self._by_id.get(tunnel_id)
+
+    def find(self, url: str, provider_name: str) -> Optional[Tunnel]:
+        """The tunnel of a configured V2Ray url on a provider, whatever url it is published under right now."""
+        return self._by_key.get((url, provider_name))
+
+    def by_provider(self, provider_name: str) -> list[Tunnel]:
+        return list(self._by_provider.get(provider_name, {}).values())
+
+    def by_uuid(self, uuid: str) -> list[Tunnel]:
+        return list(self._by_uuid.get(uuid, {}).values())
+
+    def uuids(self) -> list[str]:
+        return list(self._by_uuid)
+
+    def changes(self) -> tuple[int, int]:
+        """
+        Moves on with every add or remove and every change to a serialized field of a tunnel,
+        a cheap way to tell whether the tunnel list changed since the last look.
+        """
+        with self._lock:
+            return self._added_or_removed, sum(tunnel._changes for tunnel in self._by_id.values())
+
+    def __iter__(self) -> Iterator[Tunnel]:
+        with self._lock:
+            return iter(list(self._by_id.values()))
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __contains__(self, tunnel_id: int) -> bool:
+        return tunnel_id in self._by_id
@@ -1,19 +1,56 @@
-from flask import Blueprint, render_template, jsonify
-from configuration import api_password
+from flask import Blueprint, render_template, jsonify, request
+from configuration import api_password, log_file
+from helper.logtail import tail, read_after
+from helper.logindex import LogIndex
+from tunnels import providers
 from .auth import login_required
 
 log_bp = Blueprint("logs", __name__, url_prefix=f"/{api_password}/logs")
+log_index = LogIndex(log_file, [p.__name__ for p in providers])
 
 @log_bp.route('/')
 @login_required
 def get_logs_file():
-    with open("app.log", "r") as logfile:
-        content = logfile.readlines()
-    return render_template("logs.html", logs = content[-100:], api_path=api_password)
+    content, _ = tail(log_file, 100)
+    return render_template("logs.html", logs = content, api_path=api_password)
 
 @log_bp.route("/all")
 @login_required
 def get_all_logs():
-    with open("app.log", "r") as logfile:
-        content = logfile.readlines()
-    return jsonify(content[-250:])
\ No newline at end of file
+    content, _ = tail(log_file, 250)
+    return jsonify(content)
+
+@log_bp.route("/tail")
+@login_required
+def get_log_tail():
+    """
+    ?lines=N for the last N lines, or ?after=<cursor> for the lines written since a previous call.
+    Both return the cursor to pass as ?after= next time, reset is true when the old cursor could not be followed
+    and the lines are a fresh tail instead.
+    """
+    lines = min(request.args.get("lines", 250, type=int), 5000)
+    after = request.args.get("after")
+    if after:
+        content, cursor, reset = read_after(log_file, after, lines)
+    else:
+        (content, cursor), reset = tail(log_file, lines), True
+    return jsonify({"lines": content, "cursor": cursor, "reset": reset})
+
+@log_bp.route("/search")
+@login_required
+def search_logs():
+    """
+    Filtered, paginated search, newest first, reading only the parts of the log that can match.
+    ?level=error,warning &logger=tunnels.zrok &provider=Zrok,Pinggy &since= &until= (unix time or ISO) &q=text
+    &limit=100 &before=<next from the previous page>
+    """
+    split = lambda name: [v for v in request.args.get(name, "").split(",") if v]
+    try:
+        result = log_index.search(
+            levels=split("level"), loggers=split("logger"), providers=split("provider"),
+            since=request.args.get("since"), until=request.args.get("until"), text=request.args.get("q"),
+            limit=min(request.args.get("limit", 100, type=int), 1000), before=request.args.get("before")
+        )
+    except ValueError as e:
+        return jsonify({"msg": f"Invalid search: {e}", "code": "error"}), 400
+    return jsonify(result)
@@ -0,0 +1,103 @@
+import logging
+import os
+import threading
+from configuration import standby_pool_size
+from jobs import scheduler
+from ratelimit import start_scheduler
+
+logger = logging.getLogger(__name__)
+
+class StandbyPool:
+    """
+    Pre-started provider instances for each (backend host, port, provider class).
+    A spare already has a running process and a public URL, so it can be swapped into a Tunnel in no time
+    when the live one fails. Spares count towards the provider limit like any other instance.
+    """
+    def __init__(self):
+        self._spares = {} # key -> list of started provider instances
+        self._wanted = {} # key -> pool size
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def size_for(provider_class) -> int:
+        env = os.getenv(f"{provider_class.__name__.upper()}_STANDBY")
+        return int(env) if env is not None else standby_pool_size
+
+    @staticmethod
+    def _key(provider) -> tuple:
+        return (provider.host, provider.port, provider.__class__)
+
+    def register(self, provider):
+        """Keep spares for the backend and provider class of this provider instance, filling in the background."""
+        key = self._key(provider)
+        size = self.size_for(key[2])
+        if size <= 0:
+            return
+        with self._lock:
+            self._wanted[key] = size
+        self._schedule_refill(key)
+
+    def take(self, provider):
+        """Pop a live spare for the same backend and provider class, or None."""
+        key = self._key(provider)
+        spare = None
+        with self._lock:
+            spares = self._spares.get(key, [])
+            while spares and spare is None:
+                candidate = spares.pop(0)
+                if candidate.process and candidate.process.poll() is None:
+                    spare = candidate
+                else:
+                    candidate.release()
+        if key in self._wanted:
+            self._schedule_refill(key)
+        if spare:
+            spare.on_exit = None
+        return spare
+
+    def spares(self) -> list:
+        with self._lock:
+            return [s for spares in self._spares.values() for s in spares]
+
+    def _schedule_refill(self, key: tuple):
+        host, port, provider_class = key
+        scheduler.add_job(
+            func=self._refill, args=[key], id=f"standby-{provider_class.__name__}-{host}-{port}",
+            replace_existing=True, misfire_grace_time=60
+        )
+
+    def _refill(self, key: tuple):
+        host, port, provider_class = key
+        while True:
+            with self._lock:
+                missing = self._wanted.get(key, 0) - len(self._spares.get(key, []))
+            if missing <= 0 or provider_class.tunnels >= provider_class.limit:
+                return
+            try:
+                spare = provider_class(host=host, port=port)
+            except Exception as e:
+                logger.warning(f"Unable to create standby {provider_class.__name__}: {e}")
+                return
+            try:
+                start_scheduler.wait(provider_class)
+                spare.start_tunnel()
+            except Exception as e:
+                spare.release()
+                logger.warning(f"Standby {provider_class.__name__} for {host}:{port} failed to start: {e}")
+                return
+            spare.on_exit = lambda process, spare=spare: self._spare_exited(key, spare)
+            with self._lock:
+                self._spares.setdefault(key, []).append(spare)
+            logger.info(f"Standby {provider_class.__name__} ready for {host}:{port}: {spare.tunnel_url}")
+
+    def _spare_exited(self, key: tuple, spare):
+        with self._lock:
+            spares = self._spares.get(key, [])
+            if spare not in spares:
+                return
+            spares.remove(spare)
+        spare.release()
+        logger.warning(f"Standby {key[2].__name__} for {key[0]}:{key[1]} exited, refilling")
+        self._schedule_refill(key)
+
+standby_pool = StandbyPool()
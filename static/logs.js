@@ -78,10 +78,33 @@ function showToast(message, color="#333") {
 }
 
 function updateProviderSelection(checkbox) {
-    renderLogs(filterLogs());
+    searchLogs();
 }
 
 function updateErrorLevelSelection(checkbox) {
+    searchLogs();
+}
+
+async function searchLogs() {
+    // narrowed filters are answered by the server from its log index, the whole log not just the loaded lines
+    let { selectedProviders, selectedLevels } = checkEnabled();
+    const providerFilter = selectedProviders.length > 0 && selectedProviders.length < allProviders.length;
+    const levelFilter = selectedLevels.length > 0 && selectedLevels.length < errorLevels.length;
+    if (!providerFilter && !levelFilter) {
+        await showAll();
+        renderLogs(filterLogs());
+        return;
+    }
+    let params = new URLSearchParams({ limit: 250 });
+    if (providerFilter) params.set('provider', selectedProviders.join(','));
+    if (levelFilter) params.set('level', selectedLevels.join(','));
+    let response = await fetch(`search?${params}`, { method: 'GET' , headers: { 'Accept': 'application/json' }});
+    if (!response.ok) {
+        showToast('Failed to search logs.', '#DE1A1A');
+        return;
+    }
+    let data = await response.json();
+    content = data.results.map(result => result.text); // already newest first
     renderLogs(filterLogs());
 }
 
@@ -96,32 +119,74 @@ function checkEnabled() {
 }
 
 
-let content;
+let content = [];
 
 function filterLogs() {
     let { selectedProviders, selectedLevels } = checkEnabled();
     
     if (!content || content.length === 0) return [];
     
-    return content.filter(log => {
-        const logLower = log.toLowerCase();
-        
-        // If none selected, show everything
-        const providerMatch = selectedProviders.length === 0 || selectedProviders.some(provider => logLower.includes(provider));
-        const levelMatch = selectedLevels.length === 0 || selectedLevels.some(level => logLower.includes(level));
-        
-        return providerMatch && levelMatch;
-    });
+    // If none selected, show everything
+    return content.filter(log => matchesFilters(log, selectedProviders, selectedLevels));
 }
+const maxLogLines = 1000;
+const pollInterval = 5000;
+let cursor = null;
+
 async function showAll() {
-    content = await fetch("all", { method: 'GET' , headers: { 'Accept': 'application/json' }});
-    content = await content.json();
-    renderLogs(content.reverse());
+    let response = await fetch("tail?lines=250", { method: 'GET' , headers: { 'Accept': 'application/json' }});
+    let data = await response.json();
+    cursor = data.cursor;
+    content = data.lines.reverse(); // newest first
+    renderLogs(content);
 }
 
-function renderLogs(logs) {
+function matchesFilters(log, selectedProviders, selectedLevels) {
+    const logLower = log.toLowerCase();
+    const providerMatch = selectedProviders.length === 0 || selectedProviders.some(provider => logLower.includes(provider));
+    const levelMatch = selectedLevels.length === 0 || selectedLevels.some(level => logLower.includes(level));
+    return providerMatch && levelMatch;
+}
+
+async function pollLogs() {
+    // only the lines written since the last cursor, the server follows log rollovers
+    if (!cursor) return;
+    let response = await fetch(`tail?after=${encodeURIComponent(cursor)}`, { method: 'GET' , headers: { 'Accept': 'application/json' }});
+    if (!response.ok) return;
+    let data = await response.json();
+    cursor = data.cursor;
+    if (data.reset) {
+        content = data.lines.reverse();
+        renderLogs(filterLogs());
+        return;
+    }
+    if (data.lines.length === 0) return;
+    let newLines = data.lines.reverse();
+    content = newLines.concat(content).slice(0, maxLogLines);
+
+    let { selectedProviders, selectedLevels } = checkEnabled();
+    let logSection = document.getElementById('log-entries');
+    let noLogs = logSection.querySelector('.no-logs');
+    let shown = newLines.filter(log => matchesFilters(log, selectedProviders, selectedLevels));
+    if (shown.length && noLogs) noLogs.remove();
+    shown.reverse().forEach(log => logSection.prepend(createLogEntry(log)));
+    while (logSection.children.length > maxLogLines) {
+        logSection.lastElementChild.remove();
+    }
+}
+
+function createLogEntry(log) {
     const errorColor = '#ff0019e8';
     const warningColor = '#dc8f00';
+    let color = log.toLowerCase().includes('error') ? errorColor :
+            log.toLowerCase().includes('warning') ? warningColor : '#000';
+    let logDiv = document.createElement('div');
+    logDiv.className = 'log-entry';
+    logDiv.innerHTML = `<p style="color:${color};">${log}</p><hr>`;
+    return logDiv;
+}
+
+function renderLogs(logs) {
     let logSection = document.getElementById('log-entries');
     logSection.innerHTML = ''; // Clear existing content
     
@@ -130,14 +195,7 @@ function renderLogs(logs) {
         return;
     }
     
-    logs.forEach(log => {
-        color = log.toLowerCase().includes('error') ? errorColor :
-                log.toLowerCase().includes('warning') ? warningColor : '#000';
-        let logDiv = document.createElement('div');
-        logDiv.className = 'log-entry';
-        logDiv.innerHTML = `<p style="color:${color};">${log}</p><hr>`;
-        logSection.appendChild(logDiv);
-    });
+    logs.forEach(log => logSection.appendChild(createLogEntry(log)));
 }
 
 // Initialize the page
@@ -153,5 +211,6 @@ document.addEventListener('DOMContentLoaded', function() {
         getAllProviders();
         // Initial render with all filters enabled
         setTimeout(() => renderLogs(filterLogs()), 100);
+        setInterval(pollLogs, pollInterval);
     });
 });
@@ -33,7 +33,7 @@ function renderTunnels(tunnels) {
         let card = document.createElement('div');
         card.className = 'card' + (tunnel.process ? '' : ' card-unavailable');
         card.innerHTML = `
-            <p onclick="showInfo(${tunnel.id})" class="provider-name">${tunnel.provider_instance}</p>
+            <p onclick="showInfo(${tunnel.id})" class="provider-name">${tunnel.provider_name}</p>
             <div class="innergrid">
                 <div class="copybox">
                     <a class="truncate" href="${tunnel.url}">${tunnel.url}</a>
@@ -96,6 +96,37 @@ function updateProviderSelection(checkbox) {
     )
 }
 
+// Tunnel state pushed by the server, id -> tunnel
+let tunnelState = new Map();
+let eventSource = null;
+
+function renderTunnelState() {
+    renderTunnels([...tunnelState.values()].sort((a, b) => a.id - b.id));
+}
+
+function connectEvents() {
+    if (!window.EventSource) {
+        getAllTunnels(); // no push support, fetch on demand
+        return;
+    }
+    eventSource = new EventSource(apiPath + '/events');
+    eventSource.addEventListener('snapshot', event => {
+        tunnelState = new Map(JSON.parse(event.data).map(tunnel => [tunnel.id, tunnel]));
+        renderTunnelState();
+    });
+    eventSource.addEventListener('tunnel', event => {
+        let tunnel = JSON.parse(event.data);
+        tunnelState.set(tunnel.id, tunnel);
+        renderTunnelState();
+    });
+}
+
+function refreshTunnels() {
+    // changes arrive over the event stream, only fetch when it is not connected
+    if (eventSource && eventSource.readyState === EventSource.OPEN) return;
+    getAllTunnels();
+}
+
 function getAllTunnels() {
     fetchwithPreload(apiPath + '/tunnels', 'GET')
     .then(data => {
@@ -112,7 +143,7 @@ function restartTunnel(id) {
     .then(data => {
         let color = data.code === 'error' ? '#DE1A1A' : '#333'; 
         showToast(data.msg, color);
-        getAllTunnels(); // Refresh the list
+        refreshTunnels(); // Refresh the list
     })
     .catch(error => {
         console.error('API error.', error);
@@ -170,7 +201,7 @@ function showInfo(id) {
         let infoContent = document.getElementById('infoContent');
         infoContent.innerHTML = `
             <div style="display: flex;">
-                <h2>Provider: ${data.provider_instance}</h2>
+                <h2>Provider: ${data.provider_name}</h2>
                 <div class="btn" style="flex-direction: row; margin-left: auto;">
                     <button onclick="restartTunnel(${id})">${restartTunnelSVG}</button>
                     <button onclick="stopTunnel(${id})">${stopTunnelSVG}</button>
@@ -285,7 +316,7 @@ function changeTunnelTimer(id, expire) {
     .then(data => {
         let color = data.code === 'error' ? '#DE1A1A' : '#333';
         showToast(data.msg, color);
-        getAllTunnels(); // Refresh the list
+        refreshTunnels(); // Refresh the list
     })
     .catch(error => {
         console.error('API error.', error);
@@ -302,7 +333,7 @@ function restartAllTunnels(scope="all") {
     })
     .then(data => {
         showToast('All tunnels restarted successfully.');
-        getAllTunnels(); // Refresh the list
+        refreshTunnels(); // Refresh the list
     })
     .catch(error => {
         console.error('API error.', error);
@@ -314,7 +345,7 @@ function stopTunnel(id) {
     fetchwithPreload(apiPath + '/tunnels/' + id, 'DELETE')
     .then(data => {
         showToast('Tunnel stopped successfully.');
-        getAllTunnels(); // Refresh the list
+        refreshTunnels(); // Refresh the list
     })
     .catch(error => {
         console.error('API error.', error);
@@ -325,8 +356,12 @@ function stopTunnel(id) {
 function stopAllTunnels() {
     fetchwithPreload(apiPath + '/tunnels/all', 'DELETE', preload=false)
     .then(data => {
-        showToast('All tunnels stopped successfully.');
-        getAllTunnels(); // Refresh the list
+        if (data && data.code === 'error') {
+            showToast(data.msg, '#DE1A1A'); // some tunnels failed to stop, see data.results
+        } else {
+            showToast('All tunnels stopped successfully.');
+        }
+        refreshTunnels(); // Refresh the list
     })
     .catch(error => {
         console.error('API error.', error);
@@ -423,6 +458,6 @@ function toggleShowHide() {
     let providerSection = document.getElementById('providers-toggles');
     providerSection.style.display = (providerSection.style.display === 'block' || providerSection.style.display === '') ? 'none' : 'block';
 }
-getAllTunnels(); // Initial fetch to populate tunnels
+connectEvents(); // Initial snapshot of the tunnels, then pushed updates
 getAllProviders(); // Initial fetch to populate providers
 document.getElementById('copySVG').innerHTML = copySVG; // Set the copy button SVG
@@ -0,0 +1,53 @@
+from __future__ import annotations
+import datetime
+import logging
+import random
+from typing import TYPE_CHECKING
+from configuration import auto_restart, restart_backoff, restart_backoff_max
+from helper import metrics
+from jobs import scheduler
+
+if TYPE_CHECKING:
+    from tunnels import Tunnel
+
+logger = logging.getLogger(__name__)
+
+def backoff_delay(attempt: int) -> float:
+    """
+    Exponential backoff with jitter, somewhere between half and all of base * 2^attempt, capped at the maximum.
+    """
+    delay = min(restart_backoff_max, restart_backoff * 2 ** attempt)
+    return delay * random.uniform(0.5, 1.0)
+
+def schedule_restart(tunnel: Tunnel):
+    """
+    Restart a tunnel whose process died, after a backoff that grows with every consecutive failure.
+    """
+    if not auto_restart:
+        return
+    delay = backoff_delay(tunnel.restart_attempts)
+    logger.info(f"Restarting {tunnel.provider_name} tunnel in {delay:.1f}s (attempt {tunnel.restart_attempts + 1})")
+    scheduler.add_job(
+        func=_restart, args=[tunnel],
+        trigger="date", run_date=datetime.datetime.now() + datetime.timedelta(seconds=delay),
+        id=f"restart-{id(tunnel)}", replace_existing=True, misfire_grace_time=60
+    )
+
+def cancel_restart(tunnel: Tunnel):
+    try:
+        scheduler.remove_job(f"restart-{id(tunnel)}")
+    except: pass
+
+def _restart(tunnel: Tunnel):
+    if tunnel.process: # already running again, e.g. started by hand
+        return
+    tunnel.restart_attempts += 1
+    metrics.increment("restarts", tunnel.provider_name)
+    tunnel.keepalived = True # keep the expiry it had before it died
+    try:
+        tunnel.start()
+    except Exception as e:
+        logger.error(f"Restart of {tunnel.provider_name} tunnel failed: {e}")
+        schedule_restart(tunnel)
+    finally:
+        tunnel.keepalived = False
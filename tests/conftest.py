@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# the app's modules are imported from the repository root, as when running main.py
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,61 @@
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+import pytest
+from helper import processes
+from tunnels.base import __BaseTunnel as BaseTunnel
+
+root = Path(__file__).resolve().parent.parent
+
+# the previous run of the app: starts a provider that keeps writing, leaves it running for the next start and exits
+previous_run = """
+import json, sys
+from helper import processes
+process = processes.spawn_logged(["sh", "-c", "while :; do echo tick; sleep 0.05; done"], "Writer")
+processes.keep.add(process.pid)
+print(json.dumps([process.pid, processes.start_time(process.pid), process.args, process.output_path]))
+"""
+
+class Writer(BaseTunnel):
+    limit = 5
+    tunnel_url_regex = r"https://[^\s]+\.test\.com"
+
+class TextWriter(Writer):
+    def read_stdout(self):
+        for line in self.process.stdout:
+            self.log_queue.put(f"text {line.strip()}")
+
+def start_previous_run(tmp_path):
+    result = subprocess.run(
+        [sys.executable, "-c", previous_run], cwd=tmp_path, capture_output=True, text=True, check=True,
+        env={"PATH": "/usr/bin:/bin", "PYTHONPATH": str(root), "TUNNEL_OUTPUT_DIR": str(tmp_path)},
+    )
+    pid, started, args, output_path = json.loads(result.stdout.strip().splitlines()[-1])
+    return processes.adopt(pid, started, args, output_path)
+
+def wait_for(condition, timeout: float = 5) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+@pytest.mark.parametrize("provider_class, line", [(Writer, "tick"), (TextWriter, "text tick")])
+def test_adopted_process_keeps_writing(tmp_path, provider_class, line):
+    process = start_previous_run(tmp_path)
+    assert process is not None, "the provider died with the run that started it"
+    provider = provider_class(host="127.0.0.1", port=1)
+    try:
+        provider.adopt(process, "u1.test.com")
+        assert wait_for(lambda: provider.log_queue.tail(1) == [line])
+        time.sleep(0.5) # long past the point where a pipe to the exited run would have killed it with SIGPIPE
+        assert process.poll() is None
+        written = provider.log_queue.total
+        assert wait_for(lambda: provider.log_queue.total > written)
+    finally:
+        processes.terminate(process, 1)
+        provider.release()
+    assert wait_for(lambda: not Path(process.output_path).exists()), "the output file outlived its process"
@@ -0,0 +1,58 @@
+import pytest
+import ratelimit
+from ratelimit import StartScheduler
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit.time, "monotonic", clock)
+    return clock
+
+class Closing:
+    """A provider like Pinggy, its server needs the old session closed before it takes a new one."""
+    start_rate = 0.5
+    start_burst = 1
+    restart_delay = 2
+
+class Unpaced:
+    start_rate = None
+
+def test_start_after_stop_waits_restart_delay(clock):
+    scheduler = StartScheduler()
+    assert scheduler.reserve(Closing) == 0
+    clock.now += 60 # long running, the bucket is full again
+    scheduler.stopped(Closing)
+    assert scheduler.reserve(Closing) == pytest.approx(2)
+
+def test_restart_delay_counts_from_the_stop(clock):
+    scheduler = StartScheduler()
+    scheduler.stopped(Closing)
+    clock.now += 1.5
+    assert scheduler.reserve(Closing) == pytest.approx(0.5)
+    clock.now += 10
+    assert scheduler.reserve(Closing) == 0
+
+def test_start_rate_still_applies_after_the_delay(clock):
+    scheduler = StartScheduler()
+    scheduler.stopped(Closing)
+    clock.now += 5
+    assert scheduler.reserve(Closing) == 0
+    assert scheduler.reserve(Closing) == pytest.approx(2) # the bucket, 0.5 starts per second
+
+def test_no_restart_delay_starts_right_away(clock):
+    scheduler = StartScheduler()
+    scheduler.stopped(Unpaced)
+    assert scheduler.reserve(Unpaced) == 0
+
+def test_restart_delay_env_override(clock, monkeypatch):
+    monkeypatch.setenv("CLOSING_RESTART_DELAY", "5")
+    scheduler = StartScheduler()
+    scheduler.stopped(Closing)
+    assert scheduler.reserve(Closing) == pytest.approx(5)
@@ -1,16 +1,25 @@
 import logging
 logger = logging.getLogger(__name__)
 
-from configuration import tunnel_urls
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from configuration import tunnel_urls, start_concurrency, bulk_workers
 from tunnels import providers, Tunnel
+from registry import TunnelRegistry
+from journal import journal
+from helper import processes
 
 
 tunnels = tunnel_urls
-tun_tasks = []
+registry = TunnelRegistry()
 
 def prepare_tunnels():
     for tunnel in tunnels:
-        for provider in providers:
+        for provider in list(providers): # a provider that fails to load removes itself from the list
+            if registry.find(tunnel, provider.__name__):
+                continue
             try:
                 tunnel_instance = Tunnel(
                     url=tunnel,
@@ -18,7 +27,45 @@ def prepare_tunnels():
                 )
             except Exception as e:
                 continue
-            tun_tasks.append(tunnel_instance)
+            registry.add(tunnel_instance)
+
+def restore_tunnels():
+    """
+    Pick up where the previous run of the app left off, from the state journal: adopt the provider processes still
+    running, start again the tunnels whose process died and stop the processes of tunnels no longer configured.
+    Dead tunnels are started in the background.
+    """
+    if journal is None:
+        return
+    to_start = []
+    for record in journal.records():
+        tunnel = registry.find(record.url, record.provider)
+        process = processes.adopt(record.pid, record.pid_start, record.args, record.output) if record.pid else None
+        if process and not record.output: # journaled before output files, it writes to the previous run's pipe
+            processes.terminate(process)
+            process = None
+        elif process is None:
+            processes.remove_output(record.output) # exited while no app was running
+        expired = record.tun_end_time is not None and record.tun_end_time <= time.time()
+        if tunnel is None or expired:
+            if process:
+                processes.terminate(process)
+            journal.forget(record.url, record.provider)
+            reason = "expired" if tunnel else "no longer configured"
+            logger.info(f"Dropped journaled {record.provider} tunnel for {record.url}, {reason}")
+            continue
+        if process:
+            try:
+                tunnel.adopt(process, record.public_url, record.tun_start_time, record.tun_end_time)
+            except Exception as e: # the provider no longer loads, or is at its limit
+                logger.error(f"Unable to adopt journaled {record.provider} tunnel for {record.url}: {e}")
+                processes.terminate(process)
+                journal.forget(record.url, record.provider)
+        else:
+            to_start.append(tunnel)
+    if to_start:
+        logger.info(f"Restarting {len(to_start)} journaled tunnels whose process is gone")
+        threading.Thread(target=start_tunnels, args=(to_start,), daemon=True, name="restore").start()
 
 def reset_one_tunnel(tunnel: Tunnel):
     """
@@ -37,4 +84,82 @@ def stop_one_tunnel(tunnel: Tunnel):
     try:
         tunnel.stop()
     except Exception as e:
-        raise RuntimeError(str(e))
\ No newline at end of file
+        raise RuntimeError(str(e))
+
+def start_one_tunnel(tunnel: Tunnel):
+    if tunnel.process:
+        raise RuntimeError("Tunnel is already running")
+    tunnel.start()
+
+def _reset(tunnel: Tunnel):
+    try:
+        tunnel.stop()
+    except Exception as e:
+        raise RuntimeError(f"Unable to stop: {e}")
+    tunnel.start()
+
+bulk_actions = {
+    "stop": stop_one_tunnel,
+    "start": start_one_tunnel,
+    "reset": _reset,
+}
+
+def bulk_tunnels(action: str, tunnel_ids: list[int]) -> list[dict]:
+    """
+    Run a bulk action ("stop", "start" or "reset") on many tunnels at once, at most BULK_WORKERS at a time.
+    Every tunnel is attempted whatever happens to the others, returns one result per id in the order given.
+    """
+    run = bulk_actions[action]
+    tunnel_ids = list(dict.fromkeys(tunnel_ids)) # the same tunnel twice would race itself
+
+    def one(tunnel_id: int) -> dict:
+        tunnel = registry.get(tunnel_id)
+        if tunnel is None:
+            return {"id": tunnel_id, "code": "error", "msg": "Tunnel not found"}
+        try:
+            run(tunnel)
+        except Exception as e:
+            logger.error(f"Bulk {action} of {tunnel.provider_name} tunnel {tunnel_id} failed: {e}")
+            return {"id": tunnel_id, "code": "error", "msg": f"Unable to {action} tunnel", "details": str(e)}
+        return {"id": tunnel_id, "code": "success", "public_url": tunnel.public_url}
+
+    if not tunnel_ids:
+        return []
+    with ThreadPoolExecutor(max_workers=min(bulk_workers, len(tunnel_ids)), thread_name_prefix=f"bulk-{action}") as pool:
+        return list(pool.map(one, tunnel_ids))
+
+def start_tunnels(tunnels_to_start: list[Tunnel], on_progress=None) -> list[tuple[Tunnel, Exception | None]]:
+    """
+    Start many tunnels on one asyncio event loop instead of one thread per tunnel.
+    Concurrent starts are capped per provider class by its `start_concurrency` attribute (START_CONCURRENCY by default).
+    on_progress(done, total, tunnel, error) is called as each tunnel finishes.
+    """
+    return asyncio.run(_start_all(tunnels_to_start, on_progress))
+
+async def _start_all(tunnels_to_start, on_progress):
+    semaphores = {}
+    total = len(tunnels_to_start)
+
+    async def start_one(tunnel: Tunnel):
+        try:
+            provider = tunnel.instance().__class__ # imports a manifest provider's module the first time
+        except Exception as e:
+            return tunnel, e
+        if provider not in semaphores:
+            semaphores[provider] = asyncio.Semaphore(getattr(provider, "start_concurrency", start_concurrency))
+        async with semaphores[provider]:
+            try:
+                await tunnel.start_async()
+                return tunnel, None
+            except Exception as e:
+                return tunnel, e
+
+    results = []
+    for finished in asyncio.as_completed([start_one(t) for t in tunnels_to_start]):
+        tunnel, error = await finished
+        results.append((tunnel, error))
+        status = f"failed: {error}" if error else tunnel.public_url
+        logger.info(f"[{len(results)}/{total}] {tunnel.provider_name} {status}")
+        if on_progress:
+            on_progress(len(results), total, tunnel, error)
+    return results
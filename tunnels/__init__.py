@@ -8,12 +8,20 @@ from dataclasses import dataclass, field
 import subprocess
 import time
 from typing import Optional, Any
-from helper.subscription import add_subscription, remove_subscription
-from configuration import mode
+from helper.subscription import add_subscription, remove_subscription, user_token
+from configuration import mode, rotation_mode, restart_stable_after, enabled_providers, stop_timeout
 import importlib
 import inspect
+import json
+import threading
 from pathlib import Path
 from jobs import scheduler
+from standby import standby_pool
+from ratelimit import start_scheduler
+from journal import journal
+import supervisor
+from helper import metrics, events, processes
+from helper.check import check_timings
 import datetime
 
 import logging
@@ -21,40 +29,185 @@ logger = logging.getLogger(__name__)
 
 ignored_tunnels = ["MockCloudflareTunnel", "BadTunnel", "NewCFTunnel"] if mode == "prod" else []
 
+import_timings = {} # module name -> seconds spent importing it, including its prerequisite checks
+
+def _import_provider_module(module_name: str):
+    started = time.perf_counter()
+    try:
+        module = importlib.import_module(module_name)
+        logger.info(f"Loaded provider module: {module_name}")
+        return module
+    finally:
+        import_timings[module_name] = round(time.perf_counter() - started, 4)
+
+class ProviderSpec:
+    """
+    A provider known from tunnels/manifest.json. Its module, and the prerequisite checks at the top of it,
+    are only imported the first time a tunnel uses the provider. Calling the spec creates a provider instance.
+    The manifest only names the class and its module, limits and URL patterns are read from the class itself.
+    """
+    def __init__(self, name: str, module: str):
+        self.__name__ = name
+        self.module = module
+        self.available = True # False once loading showed the provider can't start tunnels
+        self._class = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._class is not None
+
+    def load(self):
+        with self._lock:
+            if self._class is None:
+                if not self.available:
+                    raise RuntimeError(f"{self.__name__} is not available, please check the logs.")
+                provider_class = getattr(_import_provider_module(self.module), self.__name__)
+                if not hasattr(provider_class, "start_tunnel"):
+                    # e.g. Tailscale without TAILSCALE_MODE, its module falls back to a class that can't start tunnels
+                    self.available = False
+                    if self in providers:
+                        providers.remove(self)
+                    logger.warning(f"{self.__name__} can not start tunnels, removed it from the providers")
+                    raise RuntimeError(f"{self.__name__} is not available, please check the logs.")
+                self._class = provider_class
+            return self._class
+
+    def __call__(self, *args, **kwargs):
+        return self.load()(*args, **kwargs)
+
+    def __repr__(self):
+        return f"ProviderSpec({self.__name__}, loaded={self.loaded}, available={self.available})"
+
+def _wanted(name: str) -> bool:
+    if name in ignored_tunnels or name.startswith("__"):
+        return False
+    return not enabled_providers or name in enabled_providers
+
 providers = []
 provider_dir = Path(__file__).parent
+with open(provider_dir / "manifest.json") as f:
+    manifest = json.load(f)
+for entry in manifest["providers"]:
+    if _wanted(entry["name"]):
+        providers.append(ProviderSpec(**entry))
+        logger.info(f"Registered provider: {entry['name']}")
+
+# providers added without a manifest entry are discovered the old way, by importing their module
+known_modules = {entry["module"] for entry in manifest["providers"]} | set(manifest["not_providers"])
 for provider_file in provider_dir.glob("*.py"):
     if provider_file.name == "__init__.py" or provider_file.name.startswith("_"):
         continue
     module_name = f"tunnels.{provider_file.stem}"
+    if module_name in known_modules:
+        continue
     try:
-        module = importlib.import_module(module_name)
-        logger.info(f"Loaded provider module: {module_name}")
+        module = _import_provider_module(module_name)
     except ImportError as e:
         logger.error(f"Failed to load provider module {module_name}: {e}")
+        continue
     for _, obj in inspect.getmembers(module):
-        if inspect.isclass(obj) and hasattr(obj, 'start_tunnel') and obj.__name__ not in ignored_tunnels and not obj.__name__.startswith("__"):
+        if inspect.isclass(obj) and hasattr(obj, 'start_tunnel') and _wanted(obj.__name__):
             providers.append(obj)
             logger.info(f"Registered provider: {obj.__name__}")
 
-@dataclass
+def startup_report() -> dict:
+    """
+    Where provider loading spent its time: per module import, and per prerequisite check inside it.
+    Manifest providers show up once they have been loaded.
+    """
+    return {
+        "total": round(sum(import_timings.values()), 4),
+        "imports": dict(sorted(import_timings.items(), key=lambda item: -item[1])),
+        "checks": check_timings,
+    }
+
+if import_timings:
+    logger.info("Provider startup timing: " + ", ".join(
+        f"{name} {seconds * 1000:.0f}ms" for name, seconds in startup_report()["imports"].items()
+    ))
+
+def _type_name(value) -> Optional[str]:
+    return type(value).__name__ if value is not None else None
+
+# what the API shows of a Tunnel, field -> conversion, objects that are not JSON are shown by their type name
+serialization_schema = {
+    "id": None,
+    "url": None,
+    "old_url": None,
+    "provider_name": None,
+    "provider_instance": _type_name,
+    "v": _type_name,
+    "public_url": None,
+    "process": _type_name,
+    "tun_start_time": None,
+    "tun_end_time": None,
+    "expire_job": _type_name,
+    "keepalived": None,
+    "restart_attempts": None,
+}
+
+@dataclass(frozen=True, slots=True)
+class TunnelConfig:
+    """What a tunnel was configured as, never changes once the Tunnel is created."""
+    url: str # V2Ray URL as configured, before any host is swapped in
+    provider_name: str
+    uuid: str
+    host: str
+    port: Optional[str]
+
+@dataclass(slots=True)
 class Tunnel:
     url: str # URL of V2Ray format
-    provider_instance: object  # Must have a .start(self) method
+    provider_instance: object  # given the provider class or manifest spec, the instance is created by instance()
     v: Optional[VLESS | VMESS]= None
 
     public_url: Optional[str] = None
     process: Optional[subprocess.Popen] = None
     tun_start_time: Optional[float] = None
     tun_end_time: Optional[float] = None
-    logs: list[str] = field(default_factory=list)
 
-    keepalived = False
     expire_job: Any = None # tracking auto expire     
+    restart_attempts: int = 0 # consecutive restarts by the supervisor
+    id: Optional[int] = None # stable id, set by the TunnelRegistry
+
+    # set up by __post_init__ and while running, slots rather than a __dict__ per tunnel
+    keepalived: bool = field(default=False, init=False)
+    config: Optional[TunnelConfig] = field(default=None, init=False)
+    provider_name: Optional[str] = field(default=None, init=False)
+    provider: Any = field(default=None, init=False, repr=False) # the provider class or ProviderSpec
+    old_url: Optional[str] = field(default=None, init=False)
+    _json: Optional[str] = field(default=None, init=False, repr=False)
+    _changes: int = field(default=0, init=False, repr=False)
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if name in serialization_schema:
+            # state changed, encode again on the next read
+            object.__setattr__(self, "_json", None)
+            object.__setattr__(self, "_changes", getattr(self, "_changes", 0) + 1)
+
+    def to_dict(self) -> dict:
+        return {
+            field: convert(getattr(self, field, None)) if convert else getattr(self, field, None)
+            for field, convert in serialization_schema.items()
+        }
+
+    def to_json(self) -> str:
+        """
+        JSON of to_dict(), encoded once and reused until one of the serialized fields is assigned.
+        """
+        encoded = getattr(self, "_json", None)
+        if encoded is None:
+            changes = self._changes
+            encoded = json.dumps(self.to_dict())
+            if changes == self._changes: # not cached if a field changed while encoding
+                object.__setattr__(self, "_json", encoded)
+        return encoded
 
     def __eq__(self, other):
         if isinstance(other, Tunnel):
-            return self.url == other.url and self.provider_instance.__class__.__name__ == other.provider_instance.__class__.__name__
+            return self.url == other.url and self.provider_name == other.provider_name
         return False
 
     def __post_init__(self):
@@ -73,28 +226,170 @@ class Tunnel:
             
         host = self.v.host
         port = self.v.port
-        self.provider_instance = self.provider_instance(host=host, port=port)
-        self.provider_name = self.provider_instance.__class__.__name__
+        user_token(self.v.uuid) # so the user's own subscription link works before anything is published
+        # the instance, and with it a manifest provider's module, waits until the tunnel is first started or adopted
+        self.provider, self.provider_instance = self.provider_instance, None
+        self.provider_name = self.provider.__name__
+        self.config = TunnelConfig(self.url, self.provider_name, self.v.uuid, host, port)
+
+    def instance(self):
+        """
+        The provider instance, created the first time the tunnel needs one. It takes a slot of the provider limit.
+        """
+        if self.provider_instance is None:
+            provider_instance = self.provider(host=self.config.host, port=self.config.port)
+            provider_instance.on_exit = self._process_exited
+            self.provider_instance = provider_instance
+        return self.provider_instance
 
     @property
     def hashed(self):
         return hash(self.url + self.provider_name)
 
     def start(self):
-        if self.provider_instance is None:
-            raise ValueError("Provider instance is not set.")
+        try:
+            self.instance()
+        except Exception as e:
+            self._start_failed(e)
+        if self._adopt_standby():
+            return
+        start_scheduler.wait(self.provider_instance.__class__)
         try:
             self.process, self.public_url = self.provider_instance.start_tunnel()
-            pass
         except Exception as e:
-            logger.error(f"Error starting tunnel with {self.provider_name}: {e}")
-            self.get_logs()
-            raise RuntimeError(e)
-        self.tun_start_time = time.time()
+            self._start_failed(e)
+        self._started()
+
+    async def start_async(self):
+        """
+        Start the tunnel from the asyncio engine (tunnelmgr.start_tunnels)
+        """
+        try:
+            self.instance()
+        except Exception as e:
+            self._start_failed(e)
+        if self._adopt_standby():
+            return
+        await start_scheduler.wait_async(self.provider_instance.__class__) # queued on the event loop, no thread held
+        try:
+            self.process, self.public_url = await self.provider_instance.start_tunnel_async()
+        except Exception as e:
+            self._start_failed(e)
+        self._started()
+
+    def adopt(self, process, public_url: str, start_time: float, end_time: Optional[float]):
+        """
+        Take over a provider process that the previous run of the app left running, found through the state journal.
+        The start time and expiry it had are kept.
+        """
+        self.instance().adopt(process, public_url)
+        self.process, self.public_url = process, public_url
         self.old_url = self.url
+        self._publish()
+        self.tun_start_time = start_time
+        keepalived, self.keepalived = self.keepalived, True # no fresh expiry
+        try:
+            self._schedule_timers()
+        finally:
+            self.keepalived = keepalived
+        if end_time:
+            self._schedule_expiry(datetime.datetime.fromtimestamp(end_time))
+        standby_pool.register(self.provider_instance)
+        logger.info(f"{self.provider_name} tunnel adopted from the previous run (pid {process.pid}): {self.public_url}")
+        self.changed()
+
+    def changed(self, stopped: bool = False):
+        """
+        Tell the dashboard and the state journal about a change, stopped when the tunnel was stopped on purpose.
+        """
+        if journal:
+            if stopped:
+                journal.forget(self.config.url, self.config.provider_name)
+            else:
+                journal.save(self)
+        events.publish("tunnel", self)
+
+    def _start_failed(self, e: Exception):
+        logger.error(f"Error starting tunnel with {self.provider_name}: {e}")
+        raise RuntimeError(e)
+
+    def _started(self):
+        self.old_url = self.url
+        self._publish()
+        self._schedule_timers()
+        standby_pool.register(self.provider_instance)
+        logger.info(f"{self.provider_name} tunnel started: {self.public_url}")
+        self.changed()
+
+    def _adopt_standby(self) -> bool:
+        """Start from a pre-started spare of the standby pool if one is available."""
+        spare = standby_pool.take(self.provider_instance)
+        if not spare:
+            return False
+        self._swap(spare).release()
+        self._started()
+        return True
+
+    def _swap(self, replacement):
+        """Make an already started provider instance the live one, returns the instance it replaced."""
+        previous = self.provider_instance
+        if replacement.log_queue is not previous.log_queue:
+            for line in replacement.log_queue.tail(replacement.log_queue.capacity):
+                previous.log_queue.put(line)
+        replacement.log_queue = previous.log_queue # keep one log history per tunnel
+        replacement.on_exit = self._process_exited
+        self.provider_instance = replacement
+        self.process, self.public_url = replacement.process, replacement.tunnel_url
+        return previous
+
+    def _republish(self, old_hash: int):
+        """Publish the URL of a swapped in process and move the keepalive job along with it, the expiry is kept."""
+        self._publish()
+        try:
+            scheduler.remove_job(f"keepalive-{old_hash}") # the job id follows the URL
+        except: pass
+        keepalived, self.keepalived = self.keepalived, True
+        try:
+            self._schedule_timers()
+        finally:
+            self.keepalived = keepalived
+        self.changed()
+
+    def _process_exited(self, process: subprocess.Popen):
+        """Called from the output reactor the moment a provider process exits."""
+        if process is not self.process: # stopped on purpose, or already replaced
+            return
+        logger.warning(f"{self.provider_name} tunnel process exited unexpectedly ({process.returncode}): {self.public_url}")
+        start_scheduler.stopped(self.provider_instance.__class__)
+        if self.tun_start_time and time.time() - self.tun_start_time > restart_stable_after:
+            self.restart_attempts = 0
+        failed_at = time.monotonic()
+        spare = standby_pool.take(self.provider_instance)
+        if spare:
+            old_hash = self.hashed
+            self._swap(spare).release()
+            self._republish(old_hash)
+            metrics.observe("failover_time", self.provider_name, time.monotonic() - failed_at)
+            logger.info(f"{self.provider_name} failed over to standby: {self.public_url}")
+            return
+        # nothing to fail over to, pull the dead URL now and restart in the background
+        curr_hash = self.hashed
+        self.process = None
+        self.keepalived = True # keep the expiry across the restart
+        try:
+            self._clear(curr_hash)
+        finally:
+            self.keepalived = False
+        self.changed()
+        supervisor.schedule_restart(self)
+
+    def _publish(self):
+        self.tun_start_time = time.time()
         self.v.update(self.public_url, self.provider_name)
         self.url = self.v.url
-        add_subscription(self)  # Add the new URL to subscriptions
+        add_subscription(self)  # Add the new URL to subscriptions, replacing this provider's previous one
+
+    def _schedule_timers(self):
         keepalive = self.provider_instance.timer.get('keepalive')
         expire = self.provider_instance.timer.get('expire')
         if keepalive > 0:
@@ -104,55 +399,108 @@ class Tunnel:
                 id=f"keepalive-{self.hashed}"
             )
         if expire > 0 and not self.keepalived:
-            expiry = datetime.datetime.now() + datetime.timedelta(seconds=expire)
-            scheduler.add_job(
-                func=self.stop, 
-                trigger="date", run_date=expiry, misfire_grace_time=60,
-                id=f"expire-{self.hashed}"
-            )
-            self.expire_job = scheduler.get_job(f'expire-{self.hashed}')
-            self.tun_end_time = expiry.timestamp()
-        logger.info(f"{self.provider_name} tunnel started: {self.public_url}")
+            self._schedule_expiry(datetime.datetime.now() + datetime.timedelta(seconds=expire))
+
+    def _schedule_expiry(self, expiry: datetime.datetime):
+        scheduler.add_job(
+            func=self.stop, 
+            trigger="date", run_date=expiry, misfire_grace_time=60,
+            id=f"expire-{self.hashed}"
+        )
+        self.expire_job = scheduler.get_job(f'expire-{self.hashed}')
+        self.tun_end_time = expiry.timestamp()
+
+    def _terminate(self, process: subprocess.Popen):
+        processes.terminate(process, stop_timeout)
+        start_scheduler.stopped(self.provider_instance.__class__)
 
     def stop(self):
         if self.process:
             curr_hash = self.hashed
-            self.process.terminate()
-            self.process.wait()
+            process, self.process = self.process, None # from here on the process exiting is expected
+            self._terminate(process)
             logger.info(f"{self.provider_name} tunnel stopped: {self.public_url}")
-            self.provider_instance.tunnel_url = None
-            self.url = self.old_url
-            self.process = None
-            self.public_url = None
-            self.tun_start_time = None
-            self.tun_end_time = None
-            remove_subscription(self)
-
-            try:
-                scheduler.remove_job(f"keepalive-{curr_hash}") # remove keepalive, expire will auto remove
-            except: pass
-            try:
-                # if user manually stop/start, remove the expire task, unless if it's being keepalived by the scheduler
-                if not self.keepalived:
-                    scheduler.remove_job(f"expire-{curr_hash}")
-            except: pass
+            self._clear(curr_hash)
         else:
             logger.warning(f"{self.provider_name} tunnel has no process to terminate.")
+        if not self.keepalived:
+            supervisor.cancel_restart(self) # stopped on purpose, don't bring it back
+            self.restart_attempts = 0
+        self.changed(stopped=not self.keepalived)
+
+    def _clear(self, curr_hash: int):
+        """Reset the tunnel record after its process is gone and pull it from the subscription."""
+        self.provider_instance.tunnel_url = None
+        self.url = self.old_url
+        self.public_url = None
+        self.tun_start_time = None
+        self.tun_end_time = None
+        remove_subscription(self)
+
+        try:
+            scheduler.remove_job(f"keepalive-{curr_hash}") # remove keepalive, expire will auto remove
+        except: pass
+        try:
+            # if user manually stop/start, remove the expire task, unless if it's being keepalived by the scheduler
+            # (by the job's own id, the URL and so the hash may have changed since it was scheduled)
+            if not self.keepalived and self.expire_job:
+                scheduler.remove_job(self.expire_job.id)
+                self.expire_job = None
+        except: pass
     
     def reset(self):
         # only the keepalive scheduler will use reset, user manual will only use start/stop
         self.keepalived = True
-        self.stop()
-        self.start()
-        self.keepalived = False
-
-    def get_logs(self):
-        prov_instance = self.provider_instance
-        while not prov_instance.log_queue.empty():
-            log_line = prov_instance.log_queue.get()
-            if log_line is None:
-                break
-            self.logs.append(log_line)
+        try:
+            if rotation_mode == "overlap" and self.process:
+                self.rotate()
+            else:
+                self.stop()
+                self.start()
+        finally:
+            self.keepalived = False
+
+    def rotate(self):
+        """
+        Make-before-break reset: start a second provider process, swap its URL into the subscription, then stop the old one.
+        Falls back to stop/start when the provider limit has no room for a second instance.
+        """
+        provider = self.provider_instance
+        provider_class = provider.__class__
+        if provider_class.tunnels >= provider_class.limit:
+            logger.info(f"{self.provider_name} is at its limit of {provider_class.limit}, rotating with stop/start")
+            self.stop()
+            self.start()
+            return
+        replacement = provider_class(host=provider.host, port=provider.port)
+        replacement.log_queue = provider.log_queue # keep one log history per tunnel
+        try:
+            start_scheduler.wait(provider_class)
+            replacement.start_tunnel()
+        except Exception as e:
+            replacement.release()
+            self._start_failed(e)
+
+        old_process, old_hash, old_public_url = self.process, self.hashed, self.public_url
+        self._swap(replacement)
+        self._republish(old_hash)
+        logger.info(f"{self.provider_name} tunnel rotated: {old_public_url} -> {self.public_url}")
+
+        self._terminate(old_process)
+        provider.tunnel_url = None
+        provider.release()
+
+    def get_logs(self, lines: int = 100, after: Optional[int] = None) -> tuple[list[str], int]:
+        """
+        Read from the provider's log ring buffer, either the last `lines` lines or every line after offset `after`.
+        Returns (lines, offset to pass as `after` next time).
+        """
+        if self.provider_instance is None: # never started, nothing logged
+            return [], after or 0
+        buffer = self.provider_instance.log_queue
+        if after is None:
+            after = buffer.total - lines
+        return buffer.since(after)
 
     def get_jobs(self):
         return scheduler.get_jobs()
@@ -1,18 +1,89 @@
-import subprocess
+import asyncio
 import threading
 import re
 import time
-import queue
 import logging
 from helper.error import tunnel_limits_exceeded, tunnel_url_not_found
-from configuration import default_timer
+from helper import metrics, processes
+from helper.reactor import reactor
+from helper.logbuffer import LogRing
+from configuration import default_timer, tunnel_log_lines
 import os
 
 global_environments = dict(os.environ)
 logger = logging.getLogger(__name__)
 
+def literal_hint(pattern: str) -> str:
+    """
+    Longest run of plain characters after the first wildcard that every match of `pattern` must contain,
+    e.g. ".trycloudflare" for r"https://[^\s]+\.trycloudflare.com". What comes before the first wildcard is the
+    scheme ("https://"), which nearly every URL line contains, so it is never used.
+    Returns "" (no prefilter) for patterns with groups or alternation, or without a literal after a wildcard.
+    """
+    if "(" in pattern or "|" in pattern:
+        return ""
+    runs, run, i = [], "", 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "\\":
+            escaped = pattern[i + 1:i + 2]
+            if escaped and not escaped.isalnum():
+                run += escaped
+            else: # character classes such as \s or \d
+                runs.append(run)
+                run = ""
+            i += 2
+        elif c in "*?{":
+            runs.append(run[:-1]) # the character before is optional or repeated
+            run = ""
+            i = pattern.find("}", i) + 1 if c == "{" else i + 1
+            if i == 0:
+                return ""
+        elif c == "+":
+            runs.append(run)
+            run = ""
+            i += 1
+        elif c == "[":
+            end = i + 1
+            if pattern[end:end + 1] == "^":
+                end += 1
+            end = pattern.find("]", end + 1)
+            if end == -1 or "\\]" in pattern[i:end + 1]:
+                return ""
+            runs.append(run)
+            run = ""
+            i = end + 1
+        elif c in ".^$":
+            runs.append(run)
+            run = ""
+            i += 1
+        else:
+            run += c
+            i += 1
+    runs.append(run)
+    if len(runs) == 1:
+        return runs[0] # no wildcard at all, the pattern is one literal
+    return max(runs[1:], key=len) # on a tie the earlier run, the one right after the wildcard starts with the domain's dot
+
+_event_lock = threading.Lock()
+
 class __BaseTunnel:
     tunnels = 0
+    start_rate = None # starts per second allowed by the service, None for no limit, see ratelimit.StartScheduler
+    start_burst = 1 # starts allowed back to back before start_rate applies
+    restart_delay = 0 # seconds to wait after a process of this provider stopped before starting the next one
+    _url_pattern = None
+    _url_hint = ""
+
+    def __init_subclass__(cls, **kwargs):
+        """Compile the provider's URL regex once, together with a cheap literal prefilter for it."""
+        super().__init_subclass__(**kwargs)
+        if "tunnel_url_regex" in cls.__dict__:
+            cls._url_pattern = re.compile(cls.tunnel_url_regex)
+            cls._url_hint = cls.__dict__.get("url_hint") or literal_hint(cls.tunnel_url_regex)
+        elif "url_hint" in cls.__dict__:
+            cls._url_hint = cls.url_hint
+
     def __init__(self, host: str, port: int, disabled: bool = False):
         self.host = host
         self.port = port
@@ -21,9 +92,12 @@ class __BaseTunnel:
         self.timer = default_timer
 
         # use this code to implement logging
-        self.log_queue = queue.Queue() # Create a queue to store log lines
+        self.log_queue = LogRing(tunnel_log_lines) # Ring buffer holding the latest log lines
         self.log_thread = None
-        self._url_found_event = threading.Event() # Event to signal when URL is found
+        self._url_event = None # see _url_found_event
+        self._wake_callback = None # set while an asyncio start is waiting on this provider
+        self.on_exit = None # called with the process once it exits, set by the owning Tunnel or standby pool
+        self._exit_watched = False # whether the reactor watches the current process through a pidfd
 
         child = type(self)
         if child.tunnels >= child.limit:
@@ -51,43 +125,149 @@ class __BaseTunnel:
         if disabled:
             raise RuntimeError(f"{child.__name__} is disabled due to configuration issue, please check the logs.")
 
+    @property
+    def _url_found_event(self) -> threading.Event:
+        """Event to signal when URL is found, or the output closed. Created on first use, most instances never start."""
+        event = self._url_event
+        if event is None:
+            with _event_lock:
+                if self._url_event is None:
+                    self._url_event = threading.Event()
+                event = self._url_event
+        return event
+
+    def adopt(self, process, tunnel_url: str):
+        """Take over an already running process of this provider, e.g. one the previous run of the app left running."""
+        self.process = process
+        self.tunnel_url = tunnel_url
+        self.log_queue.put(f"Adopted running process {process.pid}: {tunnel_url}")
+        self._exit_watched = reactor.watch_process(process, self._process_exited)
+        # follow its output file from where it is now, what it wrote while no app was running is skipped
+        try:
+            if self._has_custom_reader():
+                process.stdout = processes.OutputFollower(process, os.path.getsize(process.output_path))
+                self.log_thread = threading.Thread(target=self._watch_output, args=(process,), daemon=True)
+                self.log_thread.start()
+            else:
+                reactor.follow(process, self.handle_line, lambda: self._output_closed(process))
+        except OSError as e:
+            logger.warning(f"{self.__class__.__name__} can't follow the output of adopted process {process.pid}: {e}")
+        if not self._exit_watched:
+            logger.warning(f"{self.__class__.__name__} can't watch adopted process {process.pid}, its exit goes unnoticed until the tunnel is stopped")
+
+    def release(self):
+        """Give this instance's slot back to the provider limit, once its process is gone for good."""
+        type(self).tunnels -= 1
+
+    def handle_line(self, line: str):
+        """Handles one stripped output line: stores it, logs it and looks for the tunnel URL."""
+        self.log_queue.put(line) # Put the line into the ring buffer
+        logger.info(f"[{self.__class__.__name__}] {line}")
+
+        # once the URL is known, and on lines without the provider's domain, skip the regex entirely
+        if self.tunnel_url or self._url_pattern is None or self._url_hint not in line:
+            return
+        match = self._url_pattern.search(line)
+        if match:
+            self.tunnel_url = match.group(0).replace("https://", "")
+            logger.info(f"Tunnel URL found: {self.tunnel_url}")
+            self._wake() # Signal that the URL has been found
+
+    def _wake(self):
+        self._url_found_event.set()
+        callback = self._wake_callback
+        if callback:
+            callback()
+
     def read_stdout(self):
         """Reads stdout continuously, puts lines into a queue, and looks for the tunnel URL."""
         for line in self.process.stdout:
-            decoded_line = line.strip()
-            self.log_queue.put(decoded_line) # Put the line into the queue
-            logger.info(f"[{self.__class__.__name__}] {decoded_line}")
-
-            match = re.search(self.tunnel_url_regex, decoded_line)
-            if match:
-                self.tunnel_url = match.group(0).replace("https://", "")
-                logger.info(f"Tunnel URL found: {self.tunnel_url}")
-                self._url_found_event.set() # Signal that the URL has been found
-        # when finished reading
-        self.log_queue.put(None)
+            self.handle_line(line.strip())
 
-    def start_tunnel(self):
+    def _output_closed(self, process):
+        processes.remove_output(getattr(process, "output_path", None)) # everything it wrote has been read
+        # a reader left over from a previous process must not wake a newer start
+        if self.process is not process:
+            return
+        self._wake()
+        if not self._exit_watched: # no pidfd, a closed output is the best sign of death we have
+            self._process_exited(process)
+
+    def _process_exited(self, process):
+        if self.process is not process:
+            return
+        self._wake()
+        on_exit = self.on_exit
+        if on_exit:
+            on_exit(process)
+
+    def _watch_output(self, process):
+        """Runs an overridden read_stdout on its own thread and wakes start_tunnel once the child closes its output."""
+        try:
+            self.read_stdout()
+        finally:
+            self._output_closed(process)
+
+    def _has_custom_reader(self) -> bool:
+        # providers overriding read_stdout keep their own reader thread over the output as text lines
+        return type(self).read_stdout is not __class__.read_stdout
+
+    def _has_custom_start(self) -> bool:
+        return type(self).start_tunnel is not __class__.start_tunnel
+
+    def _spawn(self) -> float:
+        """Launches the provider process and hooks up its output, returns the spawn time."""
         mock_command = self.cmdline.format(host=self.host, port=self.port)
         logger.debug(f"Starting tunnel for {self.host}:{self.port} with command: {mock_command}")
-        self.process = subprocess.Popen(
-            mock_command.split(),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT, # Redirect stderr to stdout so all output is in one stream
-            text=True,
-            bufsize=1 # Line-buffered output
-        )
-
-        self.log_thread = threading.Thread(target=self.read_stdout, daemon=True) # Set as daemon so it exits with main program
-        self.log_thread.start()
-
-        # Wait for the URL to be found, with a timeout
-        start_time = time.time()
-        while not self.tunnel_url and (time.time() - start_time) < self.timeout and self.process.poll() is None:
-            time.sleep(0.1)
-        
+        self._url_found_event.clear()
+        start_time = time.monotonic()
+        custom_reader = self._has_custom_reader()
+        # stdout and stderr go to one output file, which outlives the app when the process is left running
+        self.process = processes.spawn_logged(mock_command.split(), self.__class__.__name__, text=custom_reader)
+        self._exit_watched = reactor.watch_process(self.process, self._process_exited)
+
+        if custom_reader:
+            self.log_thread = threading.Thread(target=self._watch_output, args=(self.process,), daemon=True) # Set as daemon so it exits with main program
+            self.log_thread.start()
+        else:
+            process = self.process
+            reactor.follow(process, self.handle_line, lambda: self._output_closed(process), offset=0)
+        return start_time
+
+    def _finish_start(self, start_time: float):
         if not self.tunnel_url:
-            self.process.kill()
+            processes.kill(self.process)
             error = tunnel_url_not_found(provider=self.__class__.__name__)
             raise RuntimeError(error)
 
-        return (self.process, self.tunnel_url)
\ No newline at end of file
+        metrics.observe("time_to_url", self.__class__.__name__, time.monotonic() - start_time)
+        return (self.process, self.tunnel_url)
+
+    def start_tunnel(self):
+        start_time = self._spawn()
+        # Block until the URL line arrives or the child exits, with a timeout
+        self._url_found_event.wait(self.timeout)
+        return self._finish_start(start_time)
+
+    async def start_tunnel_async(self):
+        """
+        Same as start_tunnel, but waits for the URL on the event loop instead of blocking a thread.
+        Providers with their own start_tunnel or read_stdout are run in a worker thread instead.
+        """
+        if self._has_custom_start() or self._has_custom_reader():
+            return await asyncio.to_thread(self.start_tunnel)
+        loop = asyncio.get_running_loop()
+        woken = loop.create_future()
+        self._wake_callback = lambda: loop.call_soon_threadsafe(_resolve, woken)
+        try:
+            start_time = self._spawn()
+            await asyncio.wait_for(woken, self.timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self._wake_callback = None
+        return self._finish_start(start_time)
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
@@ -1,9 +1,9 @@
-import subprocess
 import threading
 import re
 import time
 import logging
 from tunnels.base import __BaseTunnel
+from helper import processes
 
 logger = logging.getLogger(__name__)
 
@@ -35,13 +35,8 @@ class NewCFTunnel(__BaseTunnel):
     def start_tunnel(self):
         mock_command = "python3 cloudflare.py" 
         logger.debug(f"Starting tunnel for {self.host}:{self.port} with command: {mock_command}")
-        self.process = subprocess.Popen(
-            mock_command.split(),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT, # Redirect stderr to stdout so all output is in one stream
-            text=True,
-            bufsize=1 # Line-buffered output
-        )
+        # stdout and stderr go to an output file, self.process.stdout follows it as text lines
+        self.process = processes.spawn_logged(mock_command.split(), self.__class__.__name__, text=True)
 
         self.log_thread = threading.Thread(target=self.read_stdout, daemon=True) # Set as daemon so it exits with main program
         self.log_thread.start()
@@ -52,7 +47,7 @@ class NewCFTunnel(__BaseTunnel):
             time.sleep(0.1)
         
         if not self.tunnel_url:
-            self.process.kill()
+            processes.kill(self.process)
             logger.error("Tunnel URL not found in time.")
             raise RuntimeError("Tunnel URL not found in time.")
 
@@ -14,7 +14,10 @@ cf_bin = ctx.get("cloudflared_binary", cloudflare_binary)
 class Cloudflare(__BaseTunnel):
     limit = 99
     tunnel_url_regex = r"https://[^\s]+\.trycloudflare.com"
+    url_hint = "trycloudflare.com"
     cmdline = f"{cf_bin} tunnel --url {{host}}:{{port}} --no-autoupdate {cloudflare_extra_args}"
+    start_rate = 1 # trycloudflare quick tunnels are rate limited per client IP
+    start_burst = 5
 
     def __init__(self, host: str, port: int):
         super().__init__(host, port, disabled=not is_enabled)
@@ -16,7 +16,10 @@ lt_bin = ctx.get("lt_bin", localtunnel_binary)
 class LocalTunnel(__BaseTunnel):
     limit = 5
     tunnel_url_regex = r"https://[^\s]+\.loca.lt"
+    url_hint = "loca.lt"
     cmdline = f"{lt_bin} --port {{port}}"
+    start_rate = 0.5 # the public loca.lt server answers bursts of new tunnels with 429
+    start_burst = 2
     
     def __init__(self, host: str, port: int):
         super().__init__(host, port, disabled=not is_enabled)
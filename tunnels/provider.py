@@ -9,6 +9,8 @@ from helper.check import validate_provider, CustomCheck, BinaryCheck, NodeRuntim
 from helper.error import tunnel_url_not_found, tunnel_limits_exceeded
 from configuration import *
 from tunnels.base import __BaseTunnel
+from helper.logbuffer import LogRing
+from helper import processes
 
 # import dotenv
 # dotenv.load_dotenv()
@@ -21,6 +23,7 @@ How to implement a new provider from this template:
 1. Copy this file.
 2. Rename __ProviderTemplate to your provider name, do not include the __ prefix.
 3. Follow the comments in the instructions below to define parameters that best suits your tunnel provider.
+4. Optional. Add your provider to tunnels/manifest.json so it is only loaded when first used.
 Optional: If the default base class do not meet the requirement, you can replace the following methods 
 - reading stdout logs from tunnel providers
 - procedure to start the tunnel provider program
@@ -44,9 +47,18 @@ class __ProviderTemplate(__BaseTunnel):
     tunnel_url_regex = r'https://[^\s]+\.some.tunnel.domain' 
     ### Required. The regular expression the program looks for when parsing the logs of the tunnel provider to get the public URL from the tunnel provider
     ### You can test your regular expression at https://regexr.com/
+    # url_hint = ".some.tunnel.domain"
+    ### Optional. Plain text every URL line contains, lines without it skip the regex. Worked out from tunnel_url_regex by default
+    # start_rate = 0.5
+    # start_burst = 1
+    ### Optional. Starts per second the service allows and how many may go back to back, extra starts wait their turn. No limit by default
+    # restart_delay = 2
+    ### Optional. Seconds the service needs after a process stopped before it accepts a new one, e.g. to close the old session
     cmdline = f"/usr/bin/sometunnel --host {{host}}:{{port}} {some_variable}" 
     ### Required. The shell command required to start the tunnel
     ### - you'll need to use {{}} for host and port to pass these parameters into the command
+    # start_concurrency = 2
+    ### Optional. How many tunnels of this provider can be starting at the same time, defaults to START_CONCURRENCY
 
 """
 You can use the following code to implement checks before initialize the tunnel. If a provider fail these checks, it will not be enabled. Make sure to uncomment the lines.
@@ -99,7 +111,7 @@ class __ProviderTemplate():
         self.host = host
         self.port = port
         self.process = None
-        self.log_queue = queue.Queue() 
+        self.log_queue = LogRing(tunnel_log_lines) 
         self.log_thread = None
         self._url_found_event = threading.Event() 
         self.limit = 9999
@@ -136,6 +148,8 @@ class __ProviderTemplate():
     def start_tunnel(self):
         """
         Implement the command used to start the tunnel, or your own logic. The method takes self, has access to its attribute and must return a tuple of (self.process: Subprocess.Popen, self.tunnel_url: str)
+        Launch the process with processes.spawn_logged (Popen in its own process group, writing to an output file), so stopping
+        the tunnel also stops anything it starts, and the process can keep running across a restart of the app.
         """
         command = f""
         """
@@ -144,13 +158,7 @@ class __ProviderTemplate():
         """
         # example_parameter = os.getenv("EXAMPLE_API_KEY", "default_value")
         logger.debug(f"Starting tunnel for {self.port} with command: {command}")
-        self.process = subprocess.Popen(
-            command.split(),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            bufsize=1
-        )
+        self.process = processes.spawn_logged(command.split(), self.__class__.__name__, text=True)
         self.log_thread = threading.Thread(target=self.read_stdout, daemon=True)
         self.log_thread.start()
 
@@ -159,7 +167,7 @@ class __ProviderTemplate():
             time.sleep(0.1)
         
         if not self.tunnel_url:
-            self.process.kill()
+            processes.kill(self.process)
             error = tunnel_url_not_found(url="CustomProvider")
             logger.error(error)
             raise RuntimeError(error)
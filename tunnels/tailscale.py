@@ -1,5 +1,4 @@
-import subprocess
-from helper.check import check_binary, is_docker
+from helper.check import run_check_command, is_docker
 from configuration import tailscale_mode, bin_path
 import logging
 from tunnels.base import __BaseTunnel
@@ -9,6 +8,7 @@ logger = logging.getLogger(__name__)
 class __TailscaleCLI(__BaseTunnel):
     limit = 1
     tunnel_url_regex = r"https://[^\s]+\.ts.net"
+    url_hint = "ts.net"
     cmdline = f"tailscale funnel {{port}}"
     
 class __TailscaleDocker:
@@ -17,12 +17,12 @@ class __TailscaleDocker:
         raise NotImplementedError("Docker-based Tailscale tunnel start is not implemented yet.")
     
 
-running_in_docker = is_docker()
-docker_present = check_binary("docker") and subprocess.call(["docker", "--version"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) == 0
-docker_capable = running_in_docker and docker_present
+def docker_capable() -> bool:
+    # only probed when the mode has to be guessed, the docker CLI result is cached by run_check_command
+    return is_docker() and run_check_command(["docker", "--version"])[0] == 0
 
 if not tailscale_mode:
-    if docker_capable:
+    if docker_capable():
         tailscale_mode = "docker"
         logger.info("TAILSCALE_MODE not set, but found Docker capabilities. Defaulting to 'docker' mode.")
     else:
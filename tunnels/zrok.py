@@ -13,6 +13,7 @@ class Zrok(__BaseTunnel):
     limit = 99
     timeout = 15 # zrok may take longer to start
     tunnel_url_regex = r"https://[^\s]+\.zrok.io"
+    url_hint = "zrok.io"
     cmdline = f"{z_bin} share public {{host}}:{{port}}"
 
     def __init__(self, host: str, port: int):
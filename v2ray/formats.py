@@ -0,0 +1,125 @@
+"""
+Subscription encoders. Each one takes the published entries, a list of (url, proxy) where proxy is the dict
+from V2Ray.to_proxy(), and returns the subscription body as text.
+"""
+import base64
+import json
+
+group_name = "insta-v2ray"
+
+def _unique_names(entries: list[tuple[str, dict]]) -> list[str]:
+    # clash and sing-box refuse duplicate proxy names/tags
+    seen = {}
+    names = []
+    for _, proxy in entries:
+        name = proxy['name'] or f"{proxy['protocol']}-{proxy['server']}"
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}-{seen[name]}"
+        else:
+            seen[name] = 1
+        names.append(name)
+    return names
+
+def encode_base64(entries: list[tuple[str, dict]]) -> str:
+    """
+    v2rayN style, base64 of the newline joined share links
+    """
+    return base64.b64encode("\n".join(url for url, _ in entries).encode("utf-8")).decode("ascii")
+
+def _clash_proxy(name: str, proxy: dict) -> dict:
+    out = {
+        'name': name,
+        'type': proxy['protocol'],
+        'server': proxy['server'],
+        'port': proxy['port'],
+        'uuid': proxy['uuid'],
+        'udp': True,
+        'tls': proxy['tls'],
+        'network': proxy['network'],
+    }
+    if proxy['protocol'] == 'vmess':
+        out['alterId'] = proxy['alter_id']
+        out['cipher'] = proxy['cipher']
+    if proxy['flow']:
+        out['flow'] = proxy['flow']
+    if proxy['sni']:
+        out['servername'] = proxy['sni']
+    if proxy['fingerprint']:
+        out['client-fingerprint'] = proxy['fingerprint']
+    if proxy['alpn']:
+        out['alpn'] = proxy['alpn']
+    if proxy['network'] == 'ws':
+        out['ws-opts'] = {'path': proxy['path']}
+        if proxy['host']:
+            out['ws-opts']['headers'] = {'Host': proxy['host']}
+    elif proxy['network'] == 'grpc':
+        out['grpc-opts'] = {'grpc-service-name': proxy['service_name'] or ''}
+    return out
+
+def _yaml_flow(value) -> str:
+    # JSON scalars, lists and maps are valid YAML flow style, so no yaml dependency is needed
+    return json.dumps(value, ensure_ascii=False)
+
+def encode_clash(entries: list[tuple[str, dict]]) -> str:
+    """
+    Clash / Mihomo profile with every proxy and a select group in front of them
+    """
+    names = _unique_names(entries)
+    lines = ["proxies:"]
+    lines += [f"  - {_yaml_flow(_clash_proxy(name, proxy))}" for name, (_, proxy) in zip(names, entries)]
+    if not entries:
+        lines[0] = "proxies: []"
+    lines += [
+        "proxy-groups:",
+        f"  - {_yaml_flow({'name': group_name, 'type': 'select', 'proxies': names + ['DIRECT']})}",
+        "rules:",
+        f"  - {_yaml_flow(f'MATCH,{group_name}')}",
+    ]
+    return "\n".join(lines) + "\n"
+
+def _singbox_outbound(tag: str, proxy: dict) -> dict:
+    out = {
+        'type': proxy['protocol'],
+        'tag': tag,
+        'server': proxy['server'],
+        'server_port': proxy['port'],
+        'uuid': proxy['uuid'],
+    }
+    if proxy['protocol'] == 'vmess':
+        out['alter_id'] = proxy['alter_id']
+        out['security'] = proxy['cipher']
+    if proxy['flow']:
+        out['flow'] = proxy['flow']
+    if proxy['tls']:
+        out['tls'] = {'enabled': True, 'server_name': proxy['sni'] or proxy['server']}
+        if proxy['alpn']:
+            out['tls']['alpn'] = proxy['alpn']
+        if proxy['fingerprint']:
+            out['tls']['utls'] = {'enabled': True, 'fingerprint': proxy['fingerprint']}
+    if proxy['network'] == 'ws':
+        out['transport'] = {'type': 'ws', 'path': proxy['path']}
+        if proxy['host']:
+            out['transport']['headers'] = {'Host': proxy['host']}
+    elif proxy['network'] == 'grpc':
+        out['transport'] = {'type': 'grpc', 'service_name': proxy['service_name'] or ''}
+    return out
+
+def encode_singbox(entries: list[tuple[str, dict]]) -> str:
+    """
+    sing-box config with the outbounds behind a selector
+    """
+    names = _unique_names(entries)
+    outbounds = [_singbox_outbound(name, proxy) for name, (_, proxy) in zip(names, entries)]
+    outbounds += [
+        {'type': 'selector', 'tag': group_name, 'outbounds': names + ['direct']},
+        {'type': 'direct', 'tag': 'direct'},
+    ]
+    return json.dumps({'outbounds': outbounds, 'route': {'final': group_name}}, indent=2, ensure_ascii=False)
+
+# format name -> (encoder, content type), "raw" is rendered by the app from subscription.txt
+encoders = {
+    'base64': (encode_base64, 'text/plain; charset=utf-8'),
+    'clash': (encode_clash, 'text/yaml; charset=utf-8'),
+    'singbox': (encode_singbox, 'application/json'),
+}
@@ -3,12 +3,15 @@ import base64
 import json
 
 class V2Ray:
+    __slots__ = ("url", "host", "port", "uuid", "remark", "name", "all_params")
+
     def __init__(self, url: str):
         self.url = url
         self.host = None
         self.port = None
         self.uuid = None
         self.remark = None
+        self.name = None # remark as it appears in the built url
         self.all_params = {}
 
     def parse(self, url: str):
@@ -20,6 +23,13 @@ class V2Ray:
     def update(self, newhost: str, remark: str = None):
         raise NotImplementedError("Subclasses must implement this method.")
 
+    def to_proxy(self) -> dict:
+        """
+        Client neutral description of the outbound (protocol, server, transport, tls...),
+        used by v2ray.formats to build Clash and sing-box subscriptions without parsing the URL again.
+        """
+        raise NotImplementedError("Subclasses must implement this method.")
+
     def __str__(self):
         return self.url
 
@@ -28,6 +38,8 @@ class V2Ray:
 
 
 class VLESS(V2Ray):
+    __slots__ = ("new_remark",)
+
     def parse(self, url: str):
         url_parts = urllib.parse.urlparse(url)
         query_params = urllib.parse.parse_qs(url_parts.query)
@@ -48,6 +60,7 @@ class VLESS(V2Ray):
         query_string = urllib.parse.urlencode(self.all_params, doseq=True)
         fragment = f"#{self.new_remark}" if self.remark else ""
         self.url = f"vless://{netloc}?{query_string}{fragment}"
+        self.name = self.new_remark if self.remark else None
         self.new_remark = self.remark  # Reset new_remark after building URL
 
     def update(self, newhost: str, provider_remark: str = None):
@@ -62,8 +75,32 @@ class VLESS(V2Ray):
         })
         self.build_url()
 
+    def to_proxy(self) -> dict:
+        def param(key, default=None):
+            value = self.all_params.get(key, default)
+            return value[0] if isinstance(value, list) else value # parse_qs gives lists, update() sets plain strings
+        alpn = param('alpn')
+        return {
+            'protocol': 'vless',
+            'name': self.name or self.remark,
+            'server': self.host,
+            'port': int(self.port),
+            'uuid': self.uuid,
+            'network': param('type', 'tcp'),
+            'tls': param('security') == 'tls',
+            'sni': param('sni'),
+            'host': param('host'),
+            'path': urllib.parse.unquote(param('path', '/')),
+            'service_name': param('serviceName'),
+            'flow': param('flow'),
+            'fingerprint': param('fp'),
+            'alpn': alpn.split(',') if alpn else None,
+        }
+
 
 class VMESS(V2Ray):
+    __slots__ = ()
+
     def parse(self, url: str):
         url_parts = urllib.parse.urlparse(url)
         encoded_data = url_parts.netloc
@@ -97,6 +134,29 @@ class VMESS(V2Ray):
         })
         self.build_url()
 
+    def to_proxy(self) -> dict:
+        param = self.all_params.get
+        network = param('net', 'tcp')
+        alpn = param('alpn')
+        return {
+            'protocol': 'vmess',
+            'name': self.remark,
+            'server': self.host,
+            'port': int(self.port),
+            'uuid': self.uuid,
+            'alter_id': int(param('aid') or 0),
+            'cipher': param('scy') or 'auto',
+            'network': network,
+            'tls': param('tls') == 'tls',
+            'sni': param('sni'),
+            'host': param('host'),
+            'path': param('path') or '/',
+            'service_name': param('path') if network == 'grpc' else None, # vmess links carry the grpc service name in path
+            'flow': None,
+            'fingerprint': param('fp'),
+            'alpn': alpn.split(',') if alpn else None,
+        }
+
 if __name__ == "__main__":
     
     vless_example = ""